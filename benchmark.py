@@ -0,0 +1,952 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from bs4 import BeautifulSoup
+
+import u4u_bot
+
+# Páginas de prueba que imitan el marcado de cada plataforma, para medir el bot
+# sin tocar los sitios reales
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def mercadolibre_page(count, seed=0):
+    rng = random.Random(seed)
+    cards = []
+    for i in range(count):
+        original = rng.randint(200, 900)
+        current = original if i % 4 == 0 else round(original * 0.8)
+        second_line = (
+            f'<span class="ui-search-price__second-line"><span class="price-tag-fraction">{original:,}</span></span>'
+            if current != original else ''
+        )
+        cards.append(
+            f'<li class="ui-search-layout__item">'
+            f'<h2 class="ui-search-item__title">Uniforme U4U modelo {seed}-{i}</h2>'
+            f'<span class="price-tag-fraction">{current:,}</span>{second_line}'
+            f'<a class="ui-search-item__group__element" href="https://articulo.mercadolibre.com.mx/MLM-{100000 + seed * 10000 + i}-uniforme-_JM">ver</a>'
+            f'</li>'
+        )
+    return '<html><body><ol>' + ''.join(cards) + '</ol></body></html>'
+
+
+def amazon_page(count, seed=0):
+    rng = random.Random(seed)
+    cards = []
+    for i in range(count):
+        original = rng.randint(200, 900)
+        current = round(original * 0.85, 2)
+        asin = f'B{seed:04d}{i:05d}'
+        cards.append(
+            f'<div data-component-type="s-search-result" data-asin="{asin}">'
+            f'<span class="a-size-base">U4U Uniforms</span>'
+            f'<h2 class="a-size-mini"><a class="a-link-normal" href="/dp/{asin}">Filipina U4U {seed}-{i}</a></h2>'
+            f'<span class="a-price"><span class="a-offscreen">${current:,.2f}</span></span>'
+            f'<span class="a-price a-text-price"><span class="a-offscreen">${original:,.2f}</span></span>'
+            f'</div>'
+        )
+    return '<html><body><div class="s-main-slot">' + ''.join(cards) + '</div></body></html>'
+
+
+def shein_page(count, seed=0):
+    rng = random.Random(seed)
+    cards = []
+    for i in range(count):
+        current = rng.randint(150, 700)
+        discount = rng.choice([10, 20, 35, 50])
+        cards.append(
+            f'<section class="product-card" role="listitem">'
+            f'<a class="goods-title-link" href="/U4U-Scrub-{seed}-{i}-p-{2000000 + seed * 10000 + i}.html">Scrub U4U {seed}-{i} | Azul, Negro</a>'
+            f'<div class="product-card__price"><span class="normal-price-ctn__sale-price"><span>$MXN{current:,}.00</span></span></div>'
+            f'<span class="discount-text">-{discount}%</span>'
+            f'</section>'
+        )
+    return '<html><body><div class="product-list">' + ''.join(cards) + '</div></body></html>'
+
+
+PAGE_BUILDERS = {
+    'mercadolibre': mercadolibre_page,
+    'amazon': amazon_page,
+    'shein': shein_page,
+}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # Sirve /<plataforma>/<tienda>?items=N&pages=P&delay=S con el retraso indicado,
+    # y las páginas grabadas como /fixtures/<archivo>.html (siempre la misma
+    # página, sin importar la paginación). Responde con keep-alive, gzip y ETag
+    # como lo hacen las tiendas reales, y después de la última página repite
+    # esa misma página como Mercado Libre. Con status=N responde ese error
+    protocol_version = 'HTTP/1.1'
+    pages = {}  # Páginas ya generadas, para que el servidor no sea el cuello de botella
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        segments = parts.path.strip('/').split('/')
+        if segments[0] == 'fixtures' and len(segments) > 1:
+            path = os.path.join(FIXTURES_DIR, os.path.basename(segments[1]))
+            if not os.path.exists(path):
+                self.send_error(404)
+                return
+            with open(path, 'rb') as f:
+                body = f.read()
+        else:
+            builder = PAGE_BUILDERS.get(segments[0])
+            if builder is None:
+                self.send_error(404)
+                return
+            time.sleep(float(query.get('delay', ['0'])[0]))
+            if 'status' in query:
+                self.send_error(int(query['status'][0]))
+                return
+            items = int(query.get('items', ['20'])[0])
+            offset = re.search(r'_Desde_(\d+)', parts.path)
+            page = (int(offset.group(1)) - 1) // u4u_bot.PLATFORM_SPECS['MercadoLibre']['pagination']['page_size'] + 1 if offset else int(query.get('page', ['1'])[0])
+            page = min(page, int(query.get('pages', ['1'])[0]))
+            seed = int(query.get('seed', ['0'])[0]) * 100 + page
+            key = (segments[0], items, seed)
+            if key not in self.pages:
+                self.pages[key] = builder(items, seed).encode('utf-8')
+            body = self.pages[key]
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('ETag', etag)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_one_request(self):
+        # Un cliente que se rindió por tiempo límite cuelga a media respuesta;
+        # aquí eso es lo esperado y no merece un traceback
+        try:
+            super().handle_one_request()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fixture_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fixture_accounts(server, stores, items, delays, pages=1):
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    platforms = [
+        ('MercadoLibre', 'mercadolibre/tienda'),
+        ('Amazon', 'amazon/s'),
+        ('Shein', 'shein/store/home?store_code=7833912084&'),
+    ]
+    accounts = []
+    for i in range(stores):
+        platform, path = platforms[i % len(platforms)]
+        separator = '' if path.endswith('&') else '?'
+        accounts.append(u4u_bot.Account(
+            name=f'Tienda {i}',
+            url=f'{base}/{path}{separator}items={items}&pages={pages}&seed={i}&delay={delays[i % len(delays)]}',
+            platform=platform,
+        ))
+    return accounts
+
+
+class SilentBot(u4u_bot.U4UBot):
+    # Igual que el bot real pero guarda los mensajes en lugar de enviarlos y
+    # mantiene el estado en memoria. Sin límites de ritmo, porque todas las
+    # tiendas de prueba comparten el mismo host
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('state_path', ':memory:')
+        kwargs.setdefault('history_path', None)
+        kwargs.setdefault('rate_limits', {})
+        super().__init__(*args, **kwargs)
+        self.sent_messages = []
+
+    def send_whatsapp_message(self, message):
+        self.sent_messages.append(message)
+
+
+def bench_concurrency(args):
+    server = start_fixture_server()
+    delays = [round(args.delay * (0.5 + i / max(args.stores - 1, 1) * 0.5), 3) for i in range(args.stores)]
+    accounts = fixture_accounts(server, args.stores, args.items, delays)
+    print(f"{args.stores} tiendas, retrasos entre {min(delays)}s y {max(delays)}s (suma {sum(delays):.2f}s)")
+    for label, workers in (('secuencial', 1), ('concurrente', args.workers)):
+        bot = SilentBot(accounts, '+52 1 55 0000 0000', max_workers=workers, per_host=args.per_host, max_pages=1)
+        start = time.perf_counter()
+        bot.check_discounts()
+        elapsed = time.perf_counter() - start
+        bot.fetcher.shutdown()
+        print(f"  {label:<12} workers={workers:<3} ciclo={elapsed:.2f}s")
+    server.shutdown()
+
+
+def bench_sessions(args):
+    server = start_fixture_server()
+    accounts = fixture_accounts(server, args.stores, args.items, [0])
+    # Sin caché en memoria, para que cada ciclo llegue al servidor y se vean los 304
+    bot = SilentBot(accounts, '+52 1 55 0000 0000', cache_ttl=0)
+    for cycle in range(1, args.cycles + 1):
+        start = time.perf_counter()
+        bot.check_discounts()
+        elapsed = time.perf_counter() - start
+        stats = bot.last_cycle_stats
+        print(
+            f"  ciclo {cycle}: {elapsed:.2f}s, {stats['requests']} solicitudes, {stats['not_modified']} con 304, "
+            f"{stats['bytes'] / 1024:.1f} KB, {stats['new_connections']} conexiones nuevas, "
+            f"{stats['handshakes_saved']} reutilizadas"
+        )
+    bot.fetcher.shutdown()
+    server.shutdown()
+
+
+CARD_QUERIES = {
+    'MercadoLibre': (mercadolibre_page, lambda soup: soup.find_all(['div', 'li'], class_=['ui-search-layout__item', 'ui-search-result'])),
+    'Amazon': (amazon_page, lambda soup: soup.find_all('div', {'data-component-type': 's-search-result'})),
+    'Shein': (shein_page, lambda soup: soup.find_all('section', {'class': 'product-card'})),
+}
+
+
+def measure(func, repeat):
+    # Devuelve (mejor tiempo en s, pico de memoria en bytes, resultado)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def bench_parser(args):
+    # Compara el árbol completo con 'html.parser' contra solo las tarjetas con el backend elegido
+    print(f"Backend disponible: {u4u_bot.PARSER_BACKEND}")
+    for platform, (builder, find_cards) in CARD_QUERIES.items():
+        html = builder(args.items, seed=1)
+        # Un poco de marcado ajeno a los productos, como en las páginas reales
+        html = html.replace('<body>', '<body>' + '<script>var x = 1;</script><nav><a href="#">menu</a></nav>' * args.noise, 1)
+        full_time, full_peak, full_cards = measure(lambda: find_cards(BeautifulSoup(html, 'html.parser')), args.repeat)
+        fast_time, fast_peak, fast_cards = measure(lambda: find_cards(u4u_bot.parse_listing(html, platform)), args.repeat)
+        assert len(full_cards) == len(fast_cards), (platform, len(full_cards), len(fast_cards))
+        print(
+            f"  {platform:<13} {len(html) / 1024:8.0f} KB {len(fast_cards):5d} tarjetas | "
+            f"html.parser completo {full_time * 1000:7.1f} ms {full_peak / 2**20:6.1f} MB | "
+            f"{u4u_bot.PARSER_BACKEND} + tarjetas {fast_time * 1000:7.1f} ms {fast_peak / 2**20:6.1f} MB"
+        )
+
+
+def bench_pagination(args):
+    server = start_fixture_server()
+    accounts = fixture_accounts(server, args.stores, args.items, [args.delay], pages=args.pages)
+    for label, window in (('una página a la vez', 1), (f'ventana de {args.window}', args.window)):
+        bot = SilentBot(accounts, '+52 1 55 0000 0000', per_host=16, page_window=window)
+        pages_seen = {}
+        start = time.perf_counter()
+        total = 0
+        for account, page, products in bot.crawl(accounts):
+            pages_seen[account.name] = max(page, pages_seen.get(account.name, 0))
+            total += len(products)
+        elapsed = time.perf_counter() - start
+        bot.fetcher.shutdown()
+        assert total == args.stores * args.pages * args.items, total
+        requests = bot.fetcher.cycle_stats()['requests']
+        print(f"  {label:<20} {total} productos en {sum(pages_seen.values())} páginas, {requests} solicitudes, {elapsed:.2f}s")
+    server.shutdown()
+
+
+def bench_history(args):
+    # Consulta de un producto sobre meses de historial cada hora: cargar todas
+    # las columnas y filtrar, contra leer solo la columna de productos y juntar sus filas
+    with tempfile.TemporaryDirectory() as tmp:
+        history = u4u_bot.PriceHistory(tmp)
+        start_ts = int(time.time()) - args.days * 86400
+        rng = random.Random(1)
+        rows = [(f'MLM{code}', f'Tienda {code % 5}', 500.0, 400.0, 20.0) for code in range(args.products)]
+        for hour in range(args.days * 24):
+            history.append([(pid, account, original, current, rng.choice([0.0, discount]) if i == 0 else discount)
+                            for i, (pid, account, original, current, discount) in enumerate(rows)],
+                           timestamp=start_ts + hour * 3600)
+        total = args.days * 24 * args.products
+        full, full_peak, data = measure(lambda: history._load(), args.repeat)
+        single, single_peak, timeline = measure(lambda: history.timeline('MLM0'), args.repeat)
+        assert len(timeline) == args.days * 24 and len(data['ts']) == total
+        losses, _, _ = measure(lambda: history.discount_losses('MLM0', rows=timeline), args.repeat)
+        print(f"  {total} filas en {args.days} días")
+        print(f"  todas las columnas   {full * 1000:8.1f} ms  pico {full_peak / 2**20:6.1f} MB")
+        print(f"  un producto          {single * 1000:8.1f} ms  pico {single_peak / 2**20:6.1f} MB  {len(timeline)} filas")
+        print(f"  pérdidas de descuento {losses * 1000:7.1f} ms  reutilizando la línea de tiempo")
+
+
+def bench_scaling(args):
+    # Ciclo del modo coordinador/trabajadores según el número de procesos. Cada
+    # trabajador tiene su propio límite de conexiones por servidor y su propio
+    # GIL, así que el ciclo escala con tiendas lentas aun con un solo núcleo
+    server = start_fixture_server()
+    accounts = fixture_accounts(server, args.stores, args.items, [args.delay], pages=args.pages)
+    warmup = fixture_accounts(server, args.stores, 1, [0])
+    print(f"{args.stores} tiendas de {args.pages} páginas, {args.delay}s por página, {os.cpu_count()} núcleos")
+    first = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.workers:
+            path = os.path.join(tmp, f'jobs-{count}.db')
+            stop, processes = u4u_bot.start_workers(path, count, per_host=args.per_host, rate_limits={})
+            bot = SilentBot(accounts, '+52 1 55 0000 0000', jobs=u4u_bot.JobQueue(path), shards=count)
+            bot.check_discounts(warmup)  # Que todos los procesos ya hayan arrancado
+            start = time.perf_counter()
+            outcomes = bot.check_discounts()
+            elapsed = time.perf_counter() - start
+            stop.set()
+            for process in processes:
+                process.join()
+            bot.jobs.close()
+            bot.fetcher.shutdown()
+            assert 'error' not in outcomes.values(), outcomes
+            first = first or elapsed
+            print(f"  {count:>2} trabajadores  ciclo={elapsed:5.2f}s  {args.stores / elapsed:6.1f} cuentas/s  x{first / elapsed:.2f}")
+    server.shutdown()
+
+
+GARMENTS = ['Filipina', 'Pantalón', 'Conjunto Quirúrgico', 'Bata', 'Chaqueta', 'Gorro Quirúrgico', 'Casaca', 'Jogger']
+CUTS = ['Mujer', 'Hombre', 'Unisex']
+FABRICS = ['Antifluidos', 'Stretch', 'Algodón', 'Microfibra', 'Poliéster']
+COLORS = ['Azul Marino', 'Negro', 'Vino', 'Gris', 'Blanco', 'Verde Quirúrgico', 'Rosa']
+MODELS = ['Aurora', 'Bruma', 'Cedro', 'Delta', 'Estela', 'Fénix', 'Gala', 'Halo', 'Iris', 'Jade', 'Kora', 'Lumen']
+
+
+def catalog_pages(skus, divergent_share, seed=1):
+    # El mismo catálogo publicado en las tres plataformas, con el título
+    # escrito como lo hace cada una y el marcado de cada listado. En una parte
+    # de los productos, la tarjeta de Shein pierde el descuento (se queda sin
+    # porcentaje y con el precio completo) que sigue vigente en las otras dos
+    rng = random.Random(seed)
+    cards = {platform: [] for platform in u4u_bot.PLATFORM_SPECS}
+    divergent = set()
+    for sku in range(skus):
+        garment, cut, fabric, color, model = (rng.choice(options) for options in (GARMENTS, CUTS, FABRICS, COLORS, MODELS))
+        code = f"{model} {1000 + sku}"
+        price = rng.randrange(250, 1200)
+        # Al menos 15 puntos, para que el precio redondeado no quede justo en el umbral del aviso
+        discount = rng.choice([15, 20, 25, 30])
+        current = round(price * (1 - discount / 100))
+        cards['MercadoLibre'].append(
+            f'<li class="ui-search-layout__item">'
+            f'<h2 class="ui-search-item__title">{garment} Médica {cut} {fabric} {code} {color} U4U</h2>'
+            f'<span class="price-tag-fraction">{current:,}</span>'
+            f'<span class="ui-search-price__second-line"><span class="price-tag-fraction">{price:,}</span></span>'
+            f'<a class="ui-search-item__group__element" href="https://articulo.mercadolibre.com.mx/MLM-{sku}-u4u-_JM">ver</a>'
+            f'</li>'
+        )
+        cards['Amazon'].append(
+            f'<div data-component-type="s-search-result" data-asin="B{sku:09d}">'
+            f'<span class="a-size-base">U4U Uniforms</span>'
+            f'<h2 class="a-size-mini"><a class="a-link-normal" href="/dp/B{sku:09d}">'
+            f'U4U Uniforms {garment} para {cut}, {fabric}, {code} - {color}</a></h2>'
+            f'<span class="a-price"><span class="a-offscreen">${current:,.2f}</span></span>'
+            f'<span class="a-price a-text-price"><span class="a-offscreen">${price:,.2f}</span></span>'
+            f'</div>'
+        )
+        shown = f'<span class="discount-text">-{discount}%</span>'
+        if rng.random() < divergent_share:
+            divergent.add(sku)
+            current, shown = price, ''
+        cards['Shein'].append(
+            f'<section class="product-card" role="listitem">'
+            f'<a class="goods-title-link" href="/U4U-p-{sku}.html">{garment} {cut} {fabric} {code} | {color}</a>'
+            f'<div class="product-card__price"><span class="normal-price-ctn__sale-price"><span>$MXN{current:,}.00</span></span></div>'
+            f'{shown}</section>'
+        )
+    pages = {platform: '<html><body><div>' + ''.join(platform_cards) + '</div></body></html>'
+             for platform, platform_cards in cards.items()}
+    return pages, divergent
+
+
+def catalog_products(skus, divergent_share, seed=1):
+    # Productos del catálogo tal como los entrega el extractor de cada plataforma
+    pages, divergent = catalog_pages(skus, divergent_share, seed)
+    products = {}
+    for platform, html in pages.items():
+        extractor = u4u_bot.EXTRACTORS[platform]
+        products[platform], _ = extractor.extract_all(extractor.parse(html))
+    return products, divergent
+
+
+def catalog_entries(products):
+    return [
+        u4u_bot.MatchEntry(f'Tienda {platform}', platform, product.id, product.title, product.discount, product.current_price)
+        for platform, platform_products in products.items() for product in platform_products
+    ]
+
+
+def sku_of(key):
+    # MLM17, B000000017 y SHEIN17 son el mismo producto
+    return int(re.sub(r'\D', '', key[1]))
+
+
+def bench_matching(args):
+    # Emparejamiento entre plataformas con el índice invertido, contra comparar
+    # todas las parejas. Las parejas correctas son las del mismo código de producto
+    for skus in args.skus:
+        products, divergent = catalog_products(skus, args.divergent)
+        entries = catalog_entries(products)
+        matcher = u4u_bot.ProductMatcher()
+        start = time.perf_counter()
+        for entry in entries:
+            matcher.update(entry)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        divergences = matcher.divergences(list(matcher.entries))
+        search = time.perf_counter() - start
+        pairs = {frozenset((key, other)) for key in matcher.entries for other in matcher.matches(key)}
+        correct = sum(len({sku_of(key) for key in pair}) == 1 for pair in pairs)
+        print(
+            f"  {len(entries):6d} publicaciones  índice {build * 1000:7.1f} ms  búsqueda {search * 1000:7.1f} ms  "
+            f"{len(pairs)} parejas ({correct} de {3 * skus} correctas)  "
+            f"{len(divergences)} avisos (esperados {2 * len(divergent)})"
+        )
+        if len(entries) <= args.brute_max:
+            tokens = [(entry.platform, u4u_bot.title_tokens(entry.title)) for entry in entries]
+            start = time.perf_counter()
+            brute = 0
+            for i, (platform, a) in enumerate(tokens):
+                for other_platform, b in tokens[i + 1:]:
+                    if platform != other_platform and len(a & b) / len(a | b) >= matcher.similarity:
+                        brute += 1
+            print(f"  {'':6} todas las parejas {(time.perf_counter() - start) * 1000:9.1f} ms  {brute} parejas")
+        restart_check(skus, products)
+
+
+def restart_check(skus, products):
+    # Dos ejecuciones del bot sobre la misma base de estado: las parejas
+    # avisadas en la primera no se avisan otra vez en la segunda, y se borran
+    # cuando los productos vuelven a coincidir
+    accounts = [u4u_bot.Account(f'Tienda {platform}', f'https://u4u.test/{platform}', platform) for platform in products]
+    recovered, _ = catalog_products(skus, 0)
+    runs = [products, products, recovered]
+    alerts = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for run in runs:
+            bot = ReplayBot(accounts, '+52 1 55 0000 0000', state_path=os.path.join(tmp, 'state.db'),
+                            pages=[(account, 1, run[account.platform]) for account in accounts])
+            bot.check_discounts()
+            alerts.append(sum(message.count('📦') for message in bot.sent_messages if message.startswith('🔀')))
+            stored = len(bot.state.divergent_pairs())
+            bot.fetcher.shutdown()
+            bot.state.close()
+    print(f"  {'':6} reinicio: {alerts[0]} avisos, {alerts[1]} tras reiniciar (esperados 0), "
+          f"{stored} parejas guardadas tras recuperar el descuento (esperadas 0)")
+
+
+def bench_config(args):
+    # Carga de un archivo con miles de cuentas y recarga tras editar unas pocas
+    platforms = list(u4u_bot.PLATFORM_SPECS)
+    entries = [
+        {'name': f'Tienda {i}', 'url': f'https://tienda{i}.example.com/listado?seller={i}', 'platform': platforms[i % len(platforms)]}
+        for i in range(args.accounts)
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cuentas.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'phone_number': '+52 1 55 0000 0000', 'accounts': entries}, f)
+        stages = {}
+        measure_stage(stages, 'load', lambda config: config.reload(), setup=lambda: (u4u_bot.AccountConfig(path),))
+        config = u4u_bot.AccountConfig(path)
+        config.reload()
+        print(f"  carga inicial  {len(config.accounts)} cuentas en {stages['load']['seconds'] * 1000:.1f} ms, pico {stages['load']['peak_mb']:.1f} MB")
+
+        bot = SilentBot(list(config.accounts.values()), config.phone_number)
+        scheduler = u4u_bot.AdaptiveScheduler()
+        for account in config.accounts.values():
+            scheduler.add(account)
+        start = time.perf_counter()
+        u4u_bot.reload_accounts(config, bot, scheduler)
+        print(f"  sin cambios    {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        # Editar, quitar y agregar algunas cuentas
+        entries = entries[args.changes:]
+        for entry in entries[:args.changes]:
+            entry['url'] += '&orden=precio'
+        entries += [dict(entry, name=f"{entry['name']} bis") for entry in entries[-args.changes:]]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'phone_number': '+52 1 55 0000 0000', 'accounts': entries}, f)
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 1))
+        start = time.perf_counter()
+        u4u_bot.reload_accounts(config, bot, scheduler)
+        elapsed = time.perf_counter() - start
+        print(f"  con cambios    {elapsed * 1000:.1f} ms, {len(scheduler.accounts)} cuentas en la agenda")
+        bot.fetcher.shutdown()
+
+
+def bench_cache(args):
+    # Cuentas que comparten páginas, con y sin caché en memoria, y costo de
+    # guardar las copias en disco y volver a parsearlas sin conexión
+    server = start_fixture_server()
+    unique = fixture_accounts(server, args.urls, args.items, [args.delay])
+    accounts = [
+        account._replace(name=f'Cuenta {i}') for i, account in enumerate(unique * (args.stores // args.urls))
+    ]
+    print(f"{len(accounts)} cuentas sobre {args.urls} URLs distintas")
+    for label, ttl in (('sin caché', 0), ('con caché', 120)):
+        bot = SilentBot(accounts, '+52 1 55 0000 0000', cache_ttl=ttl, max_pages=1)
+        start = time.perf_counter()
+        bot.check_discounts()
+        elapsed = time.perf_counter() - start
+        bot.fetcher.shutdown()
+        print(f"  {label:<10} {bot.last_cycle_stats['requests']:>3} solicitudes  ciclo={elapsed:.2f}s")
+
+    accounts = fixture_accounts(server, args.urls, args.items, [0], pages=2)
+    with tempfile.TemporaryDirectory() as tmp:
+        for compression in ('gzip', 'zstd'):
+            if compression == 'zstd' and u4u_bot.optional_module('zstandard') is None:
+                print("  zstd       zstandard no está instalado")
+                continue
+            root = os.path.join(tmp, compression)
+            bot = SilentBot(accounts, '+52 1 55 0000 0000', cache_ttl=0, snapshot_path=root)
+            bot.snapshots.compression = compression
+            start = time.perf_counter()
+            bot.check_discounts()
+            elapsed = time.perf_counter() - start
+            bot.fetcher.shutdown()
+            snapshots = bot.snapshots
+            entries = snapshots.entries(snapshots.cycles()[-1])
+            raw = sum(len(snapshots.body(entry)) for entry in entries)
+            start = time.perf_counter()
+            products = 0
+            for entry in entries:
+                extractor = u4u_bot.EXTRACTORS[entry['platform']].for_url(entry['url'])
+                html = snapshots.body(entry).decode(entry['encoding'] or 'utf-8')
+                products += len(extractor.extract_all(u4u_bot.parse_listing(html, entry['platform']))[0])
+            replay = time.perf_counter() - start
+            print(
+                f"  {compression:<10} ciclo con copias={elapsed:.2f}s  {len(entries)} páginas, "
+                f"{raw / 1024:.0f} KB -> {snapshots._disk_usage() / 1024:.0f} KB en disco  "
+                f"reproducción={replay:.2f}s ({products} productos)"
+            )
+        bot = SilentBot(accounts, '+52 1 55 0000 0000', cache_ttl=0)
+        start = time.perf_counter()
+        bot.check_discounts()
+        print(f"  {'sin copias':<10} ciclo={time.perf_counter() - start:.2f}s")
+        bot.fetcher.shutdown()
+    server.shutdown()
+
+
+def bench_resilience(args):
+    # Tiendas sanas y tiendas caídas en hosts distintos. Las sanas no deben
+    # esperar a las caídas, y tras unas cuantas fallas el host caído se salta
+    # sin gastar tiempo hasta que una prueba salga bien
+    healthy_server = start_fixture_server()
+    broken_server = start_fixture_server()
+    healthy = fixture_accounts(healthy_server, args.stores, args.items, [args.delay])
+    broken = [
+        account._replace(name=f'Caída {i}', url=account.url + (f'&status={args.status}' if args.status else ''))
+        for i, account in enumerate(fixture_accounts(broken_server, args.stores, args.items, [0 if args.status else args.hang]))
+    ]
+    problem = f"responde {args.status}" if args.status else f"tarda {args.hang}s por página"
+    print(f"{args.stores} tiendas sanas y {args.stores} en un host que {problem}; tiempo límite de lectura {args.timeout}s")
+    bot = SilentBot(healthy + broken, '+52 1 55 0000 0000', timeout=(1, args.timeout), max_retries=1, cache_ttl=0)
+    broken_host = u4u_bot.urlsplit(broken[0].url).netloc
+    for cycle in range(1, args.cycles + 1):
+        start = time.perf_counter()
+        healthy_done = 0
+        for account, page, products in bot.crawl(bot.accounts):
+            if account in healthy:
+                healthy_done = time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+        state = ('cerrado', 'en prueba', 'abierto')[bot.fetcher.breaker(broken_host).state]
+        print(f"  ciclo {cycle}: sanas listas en {healthy_done:.2f}s, ciclo completo {elapsed:.2f}s, circuito del host caído {state}")
+    bot.fetcher.shutdown()
+    healthy_server.shutdown()
+    broken_server.shutdown()
+
+
+HEAVY_MODULES = ('pywhatkit', 'bs4', 'soupsieve', 'lxml', 'numpy', 'requests', 'yaml', 'zstandard')
+
+
+def run_python(args, cwd):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], cwd=cwd, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr[-2000:]
+    return time.perf_counter() - start, result.stdout
+
+
+def bench_startup(args):
+    # Arranque de procesos nuevos, como los que lanza cron: el intérprete solo,
+    # importar el módulo y una revisión completa con --dry-run contra tiendas
+    # locales. La revisión respeta los límites por plataforma, así que con más
+    # tiendas que la ráfaga permitida se mide sobre todo la espera por fichas
+    package = os.path.dirname(os.path.abspath(__file__))
+    probe = (f"import sys; sys.path.insert(0, {package!r}); import u4u_bot; "
+             f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))")
+    empty = min(run_python(['-c', 'pass'], package)[0] for _ in range(args.repeat))
+    runs = [run_python(['-c', probe], package) for _ in range(args.repeat)]
+    print(f"  intérprete vacío        {empty * 1000:6.0f} ms")
+    print(f"  import u4u_bot          {min(elapsed for elapsed, _ in runs) * 1000:6.0f} ms  cargados: {runs[0][1].strip() or 'ninguno'}")
+
+    server = start_fixture_server()
+    accounts = fixture_accounts(server, args.stores, args.items, [0])
+    with tempfile.TemporaryDirectory() as tmp:
+        config = os.path.join(tmp, 'cuentas.json')
+        with open(config, 'w', encoding='utf-8') as f:
+            json.dump({'accounts': [account._asdict() for account in accounts]}, f)
+        once = min(run_python([os.path.join(package, 'u4u_bot.py'), '--dry-run', '--config', config], tmp)[0]
+                   for _ in range(args.repeat))
+    server.shutdown()
+    print(f"  --dry-run, {args.stores} tienda(s) {once * 1000:6.0f} ms  de principio a fin")
+
+
+def bench_extract(args):
+    # Costo por tarjeta del motor de extracción, sin contar la descarga ni el parseo
+    for platform, (builder, _) in CARD_QUERIES.items():
+        extractor = u4u_bot.EXTRACTORS[platform].for_url('store_code=7833912084' if platform == 'Shein' else '')
+        soup = u4u_bot.parse_listing(builder(args.items, seed=1), platform)
+        cards = extractor.cards(soup)
+        best, peak, products = measure(
+            lambda: u4u_bot.ProductBatch(extractor, [extractor.fields(card) for card in cards]).products(), args.repeat
+        )
+        assert len(products) == args.items and all(products), platform
+        print(f"  {platform:<13} {len(cards)} tarjetas  {best / len(cards) * 1e6:7.1f} µs/tarjeta  pico {peak / 2**20:5.1f} MB")
+
+
+def parse_price(text):
+    # "$MXN1,234.50", "$1,234", "-35%" -> 1234.5, 1234.0, 35.0
+    return float(re.sub(r'[^\d.]', '', text))
+
+
+def products_one_by_one(extractor, rows):
+    # Referencia: la conversión de antes, una tarjeta a la vez y a diccionarios
+    products = []
+    for title, current_text, original_text, discount_text, url in rows:
+        current_price = parse_price(current_text) if current_text else 0.0
+        if discount_text is not None:
+            discount = parse_price(discount_text)
+            original_price = round(current_price / (1 - discount / 100), 2) if discount < 100 else current_price
+        else:
+            original_price = parse_price(original_text) if original_text else current_price
+            discount = 0
+            if original_price > current_price:
+                discount = round((original_price - current_price) / original_price * 100, extractor.discount_decimals)
+        products.append({
+            'id': extractor.product_id(url, title),
+            'title': title,
+            'original_price': original_price,
+            'current_price': current_price,
+            'discount': discount,
+            'url': url,
+            'platform': extractor.platform,
+        })
+    return products
+
+
+def bench_products(args):
+    # Costo de convertir los textos de las tarjetas en productos: uno por uno a
+    # diccionarios contra el lote con numpy. Los textos se leen una sola vez
+    # antes de medir, así que solo cuenta la conversión y lo que ocupa el resultado
+    for platform, (builder, _) in CARD_QUERIES.items():
+        extractor = u4u_bot.EXTRACTORS[platform].for_url('store_code=7833912084' if platform == 'Shein' else '')
+        cards = extractor.cards(u4u_bot.parse_listing(builder(args.items, seed=1), platform))
+        rows = [extractor.fields(card) for card in cards] * args.copies
+        old_time, old_peak, old = measure(lambda: products_one_by_one(extractor, rows), args.repeat)
+        new_time, new_peak, new = measure(lambda: u4u_bot.ProductBatch(extractor, rows).products(), args.repeat)
+        assert [tuple(product.values()) for product in old] == [tuple(product) for product in new], platform
+        print(
+            f"  {platform:<13} {len(rows)} productos | uno por uno {old_time / len(rows) * 1e6:5.2f} µs/producto "
+            f"pico {old_peak / 2**20:5.1f} MB | lote {new_time / len(rows) * 1e6:5.2f} µs/producto "
+            f"pico {new_peak / 2**20:5.1f} MB"
+        )
+
+
+# Páginas grabadas y la cuenta con la que se reproducen; lo esperado vive en
+# fixtures/expected.json y se regenera con 'check --update'
+REGRESSION_CASES = [
+    ('mercadolibre.html', 'MercadoLibre', ''),
+    ('amazon.html', 'Amazon', ''),
+    ('shein.html', 'Shein', '?store_code=7833912084'),
+    ('shein.html', 'Shein', '?store=grupo-maquilero'),
+]
+
+
+def bench_check(args):
+    # Reproduce las páginas grabadas por todo el recorrido (HTTP local,
+    # paginación, parseo y extracción) y compara contra lo esperado
+    server = start_fixture_server()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    accounts = [
+        u4u_bot.Account(f'{fixture}{suffix}', f'{base}/fixtures/{fixture}{suffix}', platform)
+        for fixture, platform, suffix in REGRESSION_CASES
+    ]
+    bot = SilentBot(accounts, '+52 1 55 0000 0000')
+    results = {account.name: [] for account in accounts}
+    for account, page, products in bot.crawl(accounts):
+        results[account.name].extend(
+            {key: value for key, value in product._asdict().items() if key != 'url' or not value.startswith(base)}
+            for product in products
+        )
+    bot.fetcher.shutdown()
+    server.shutdown()
+
+    expected_path = os.path.join(FIXTURES_DIR, 'expected.json')
+    if args.update:
+        with open(expected_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Actualizado {expected_path}")
+        return
+    with open(expected_path, encoding='utf-8') as f:
+        expected = json.load(f)
+    failures = 0
+    for name, products in results.items():
+        if products == expected.get(name):
+            print(f"  OK     {name}: {len(products)} productos")
+            continue
+        failures += 1
+        print(f"  FALLA  {name}")
+        got = {product['id']: product for product in products}
+        want = {product['id']: product for product in expected.get(name, [])}
+        for pid in sorted(got.keys() | want.keys()):
+            if got.get(pid) != want.get(pid):
+                print(f"         {pid}: esperado {want.get(pid)}\n         {' ' * len(pid)}  obtenido {got.get(pid)}")
+    if failures:
+        sys.exit(1)
+
+
+class ReplayBot(SilentBot):
+    # Alimenta check_discounts con páginas ya extraídas, para medir solo la comparación
+    def __init__(self, *args, pages=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pages = pages or []
+
+    def crawl(self, accounts):
+        yield from self.pages
+
+
+def measure_stage(stages, name, func, setup=tuple):
+    # tracemalloc hace mucho más lento el código medido, así que el tiempo se
+    # toma en una corrida normal y el pico de memoria en una segunda corrida.
+    # setup() prepara los argumentos de cada corrida por separado
+    args = setup()
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    args = setup()
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    stages[name] = {'seconds': seconds, 'peak_mb': peak / 2**20}
+    return result
+
+
+def bench_pipeline(args):
+    # Tiempo y pico de memoria de cada etapa sobre páginas sintéticas grandes
+    server = start_fixture_server()
+    accounts = fixture_accounts(server, 3, args.items, [0])
+    bot = SilentBot(accounts, '+52 1 55 0000 0000', cache_ttl=0)
+    stages = {}
+    responses = measure_stage(stages, 'fetch', lambda: [
+        bot.fetcher.get(account.url, platform=account.platform) for account in accounts
+    ])
+    soups = measure_stage(stages, 'parse', lambda: [
+        u4u_bot.parse_listing(response.text, account.platform) for account, response in zip(accounts, responses)
+    ])
+    extractors = [u4u_bot.EXTRACTORS[account.platform].for_url(account.url) for account in accounts]
+    extracted = measure_stage(stages, 'extract', lambda: [
+        extractor.extract_all(soup) for extractor, soup in zip(extractors, soups)
+    ])
+    # Misma página descargada otra vez sin cambios: las tarjetas se reconocen por su huella
+    measure_stage(stages, 'extract_cached', lambda: [
+        extractor.extract_all(soup, previous=fingerprints)
+        for extractor, soup, (_, fingerprints) in zip(extractors, soups, extracted)
+    ])
+    pages = [(account, 1, products) for account, (products, _) in zip(accounts, extracted)]
+    for account, _, products in pages:
+        assert len(products) == args.items, (account.name, len(products))
+    bot.fetcher.shutdown()
+    server.shutdown()
+
+    # Primer ciclo (todo es nuevo) y segundo ciclo con la mitad de los descuentos cambiados
+    changed_pages = [
+        (account, page, [product._replace(discount=(0 if product.discount else 10) if i % 2 == 0 else product.discount)
+                         for i, product in enumerate(products)])
+        for account, page, products in pages
+    ]
+
+    def fresh_bot(first_cycle=False):
+        bot = ReplayBot(accounts, '+52 1 55 0000 0000', pages=pages)
+        if first_cycle:
+            bot.check_discounts()
+            bot.pages = changed_pages
+        return (bot,)
+
+    measure_stage(stages, 'diff_first_run', lambda bot: bot.check_discounts(), setup=fresh_bot)
+    measure_stage(stages, 'diff', lambda bot: bot.check_discounts(), setup=lambda: fresh_bot(first_cycle=True))
+
+    # Texto del reporte inicial, que incluye todos los productos
+    first_events = {
+        account.name: {
+            u4u_bot.product_id(product): u4u_bot.diff_product(account, u4u_bot.product_id(product), product, None)
+            for product in products
+        }
+        for account, _, products in pages
+    }
+    measure_stage(stages, 'format', lambda: u4u_bot.render_report(accounts, first_events, first_run=True))
+
+    total = sum(stage['seconds'] for stage in stages.values())
+    print(f"  {3 * args.items} productos en 3 páginas")
+    for name, stage in stages.items():
+        print(f"  {name:<15} {stage['seconds'] * 1000:9.1f} ms  pico {stage['peak_mb']:6.1f} MB")
+    print(f"  {'total':<15} {total * 1000:9.1f} ms")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(stages, f, indent=2)
+        print(f"Línea base guardada en {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = [
+            name for name, stage in stages.items()
+            if name in baseline and stage['seconds'] > baseline[name]['seconds'] * (1 + args.tolerance)
+        ]
+        for name in regressions:
+            print(f"  REGRESIÓN {name}: {stages[name]['seconds'] * 1000:.1f} ms vs {baseline[name]['seconds'] * 1000:.1f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks del bot U4U contra páginas locales de prueba')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    concurrency = subparsers.add_parser('concurrency', help='Tiempo de ciclo secuencial vs concurrente')
+    concurrency.add_argument('--stores', type=int, default=9)
+    concurrency.add_argument('--items', type=int, default=40)
+    concurrency.add_argument('--delay', type=float, default=0.5, help='Retraso de la tienda más lenta (s)')
+    concurrency.add_argument('--workers', type=int, default=8)
+    concurrency.add_argument('--per-host', type=int, default=16)
+    concurrency.set_defaults(func=bench_concurrency)
+
+    sessions = subparsers.add_parser('sessions', help='Bytes y conexiones por ciclo con sesiones y 304')
+    sessions.add_argument('--stores', type=int, default=6)
+    sessions.add_argument('--items', type=int, default=200)
+    sessions.add_argument('--cycles', type=int, default=3)
+    sessions.set_defaults(func=bench_sessions)
+
+    parsing = subparsers.add_parser('parser', help='Parser completo vs backend rápido solo con tarjetas')
+    parsing.add_argument('--items', type=int, default=2000)
+    parsing.add_argument('--noise', type=int, default=2000, help='Bloques de marcado ajeno a productos')
+    parsing.add_argument('--repeat', type=int, default=3)
+    parsing.set_defaults(func=bench_parser)
+
+    pagination = subparsers.add_parser('pagination', help='Recorrido de catálogos de varias páginas')
+    pagination.add_argument('--stores', type=int, default=3)
+    pagination.add_argument('--pages', type=int, default=6)
+    pagination.add_argument('--items', type=int, default=48)
+    pagination.add_argument('--delay', type=float, default=0.2)
+    pagination.add_argument('--window', type=int, default=3)
+    pagination.set_defaults(func=bench_pagination)
+
+    history = subparsers.add_parser('history', help='Consulta de un producto sobre meses de historial')
+    history.add_argument('--days', type=int, default=90)
+    history.add_argument('--products', type=int, default=1000)
+    history.add_argument('--repeat', type=int, default=3)
+    history.set_defaults(func=bench_history)
+
+    scaling = subparsers.add_parser('scaling', help='Ciclo con 1, 2, 4... procesos trabajadores')
+    scaling.add_argument('--stores', type=int, default=16)
+    scaling.add_argument('--items', type=int, default=40)
+    scaling.add_argument('--pages', type=int, default=2)
+    scaling.add_argument('--delay', type=float, default=0.5)
+    scaling.add_argument('--per-host', type=int, default=2)
+    scaling.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    scaling.set_defaults(func=bench_scaling)
+
+    matching = subparsers.add_parser('matching', help='Emparejamiento de productos entre plataformas')
+    matching.add_argument('--skus', type=int, nargs='+', default=[1000, 10000])
+    matching.add_argument('--divergent', type=float, default=0.05, help='Parte de los productos que pierden el descuento en una plataforma')
+    matching.add_argument('--brute-max', type=int, default=3000, help='Publicaciones hasta las que también se comparan todas las parejas')
+    matching.set_defaults(func=bench_matching)
+
+    config = subparsers.add_parser('config', help='Carga y recarga de miles de cuentas')
+    config.add_argument('--accounts', type=int, default=5000)
+    config.add_argument('--changes', type=int, default=10, help='Cuentas editadas, quitadas y agregadas antes de recargar')
+    config.set_defaults(func=bench_config)
+
+    cache = subparsers.add_parser('cache', help='Caché en memoria y copias comprimidas en disco')
+    cache.add_argument('--stores', type=int, default=12)
+    cache.add_argument('--urls', type=int, default=3, help='URLs distintas entre todas las cuentas')
+    cache.add_argument('--items', type=int, default=200)
+    cache.add_argument('--delay', type=float, default=0.3)
+    cache.set_defaults(func=bench_cache)
+
+    resilience = subparsers.add_parser('resilience', help='Tiendas sanas junto a un host lento o caído')
+    resilience.add_argument('--stores', type=int, default=3)
+    resilience.add_argument('--items', type=int, default=40)
+    resilience.add_argument('--delay', type=float, default=0.2)
+    resilience.add_argument('--hang', type=float, default=5, help='Retraso del host caído (s)')
+    resilience.add_argument('--status', type=int, default=None, help='Código de error del host caído en lugar del retraso')
+    resilience.add_argument('--timeout', type=float, default=1)
+    resilience.add_argument('--cycles', type=int, default=4)
+    resilience.set_defaults(func=bench_resilience)
+
+    startup = subparsers.add_parser('startup', help='Arranque del módulo y de una revisión con --dry-run')
+    startup.add_argument('--stores', type=int, default=1)
+    startup.add_argument('--items', type=int, default=40)
+    startup.add_argument('--repeat', type=int, default=5)
+    startup.set_defaults(func=bench_startup)
+
+    extract = subparsers.add_parser('extract', help='Costo por tarjeta del motor de extracción')
+    extract.add_argument('--items', type=int, default=2000)
+    extract.add_argument('--repeat', type=int, default=3)
+    extract.set_defaults(func=bench_extract)
+
+    products = subparsers.add_parser('products', help='Conversión a productos: uno por uno vs por lote')
+    products.add_argument('--items', type=int, default=500)
+    products.add_argument('--copies', type=int, default=40, help='Veces que se repiten las tarjetas de la página')
+    products.add_argument('--repeat', type=int, default=5)
+    products.set_defaults(func=bench_products)
+
+    check = subparsers.add_parser('check', help='Regresión de extracción sobre páginas grabadas')
+    check.add_argument('--update', action='store_true', help='Regenerar fixtures/expected.json')
+    check.set_defaults(func=bench_check)
+
+    pipeline = subparsers.add_parser('pipeline', help='Tiempo y memoria por etapa del ciclo')
+    pipeline.add_argument('--items', type=int, default=3000)
+    pipeline.add_argument('--baseline', help='Falla si alguna etapa es más lenta que esta línea base')
+    pipeline.add_argument('--save-baseline', help='Guardar los tiempos como línea base')
+    pipeline.add_argument('--tolerance', type=float, default=0.25)
+    pipeline.set_defaults(func=bench_pipeline)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,489 +1,2703 @@
 import requests
-from bs4 import BeautifulSoup
-import schedule
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util import make_headers
 import time
-from datetime import datetime
-import pywhatkit
+import json
+import gzip
+import hashlib
+import heapq
+import importlib
+import importlib.util
+import itertools
+import mmap
+import random
+import os
+import argparse
+from datetime import datetime, timedelta
 import re
 import logging
+import multiprocessing
+import queue
+import socket
+import sqlite3
+import sys
+import unicodedata
+import numpy as np
+import threading
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from contextlib import contextmanager
+from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, quote
 
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('u4u_bot.log'),
-        logging.StreamHandler()
-    ]
-)
 
-class U4UBot:
-    def __init__(self, accounts, phone_number):
-        self.accounts = accounts  # Lista de diccionarios con información de las cuentas
-        self.phone_number = phone_number  # Guardamos el número de teléfono
-        
-        self.previous_discounts = {}  # Ahora guardará los descuentos por cuenta
-        logging.info(f"Bot iniciado con {len(accounts)} cuentas y número {phone_number}")
 
-    def get_product_info(self, account):
-        logging.info(f"Obteniendo información de productos para la cuenta: {account['name']}")
-        
-        headers = {
+def setup_logging():
+    # Solo al correr como programa; importar el módulo (trabajadores, pruebas,
+    # benchmark.py) no crea u4u_bot.log
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('u4u_bot.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+
+# Lo que no todos los procesos usan (pywhatkit, BeautifulSoup, PyYAML,
+# zstandard) se importa hasta que hace falta, para que un proceso de una
+# sola pasada o un trabajador arranque sin pagar por ello
+def optional_module(name):
+    # El módulo, o None si no está instalado
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+# lxml es mucho más rápido que 'html.parser'; si no está instalado seguimos
+# funcionando con el parser de la biblioteca estándar
+PARSER_BACKEND = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+# Especificación de cada plataforma: selectores CSS, cómo leer precios y
+# descuento, cómo armar la URL y el identificador, y cómo paginar. Agregar una
+# tienda nueva es agregar una entrada aquí, no un método nuevo
+PLATFORM_SPECS = {
+    'MercadoLibre': {
+        'headers': {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept-Language': 'es-ES,es;q=0.9'
+        },
+        # Solo se construyen los subárboles de las tarjetas de producto; el
+        # resto de la página (scripts, menús, filtros) se descarta al analizarla
+        'strainer': (['div', 'li'], {'class': ['ui-search-layout__item', 'ui-search-result']}),
+        'card': 'div.ui-search-layout__item, li.ui-search-layout__item, div.ui-search-result, li.ui-search-result',
+        'title': 'h2.ui-search-item__title, h3.ui-search-item__title',
+        'current_price': 'span.price-tag-amount, span.price-tag-fraction',
+        'original_price': 'span.ui-search-price__second-line :is(span.price-tag-amount, span.price-tag-fraction)',
+        'link': 'a.ui-search-item__group__element',
+        'required': [],
+        'default_title': 'Sin título',
+        'id_pattern': (r'(MLM)-?(\d+)', '{0}{1}'),
+        'pagination': {'offset_path': '_Desde_', 'page_size': 48},
+        'rate_limit': (2, 5),  # Solicitudes por segundo y ráfaga máxima por host
+    },
+    'Amazon': {
+        'headers': {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Language': 'es-MX,es;q=0.8,en-US;q=0.5,en;q=0.3',
+            'Connection': 'keep-alive',
+        },
+        'strainer': ('div', {'data-component-type': 's-search-result'}),
+        'card': 'div[data-component-type="s-search-result"]',
+        # Solo productos de la marca U4U Uniforms
+        'require': 'span:-soup-contains("U4U Uniforms")',
+        'title': 'h2.a-size-mini',
+        'current_price': 'span.a-price span.a-offscreen',
+        'original_price': 'span.a-price.a-text-price span.a-offscreen',
+        'link': 'a.a-link-normal',
+        'link_prefix': 'https://www.amazon.com.mx',
+        # URL canónica a partir del ASIN de la tarjeta
+        'url_attribute': ('data-asin', 'https://www.amazon.com.mx/dp/{}'),
+        # Sin precio de lista la tarjeta queda con descuento 0, para notar cuando lo pierde
+        'required': ['title', 'current_price'],
+        'discount_decimals': 2,
+        'id_pattern': (r'/(?:dp|gp/product)/([A-Z0-9]{10})', '{0}'),
+        'pagination': {'param': 'page'},
+        'rate_limit': (0.5, 2),
+        # Amazon responde 200 con una página de captcha cuando bloquea
+        'block_marker': 'validateCaptcha',
+    },
+    'Shein': {
+        'headers': {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Language': 'es-MX,es;q=0.8,en-US;q=0.5,en;q=0.3',
+            'Connection': 'keep-alive',
+        },
+        'strainer': ('section', {'class': 'product-card'}),
+        'card': 'section.product-card',
+        'title': 'a.goods-title-link',
+        'current_price': 'span.normal-price-ctn__sale-price span',
+        # Shein solo muestra el porcentaje; el precio original se reconstruye
+        'discount': 'span.discount-text',
+        'link': 'a.goods-title-link',
+        'link_prefix': 'https://www.shein.com.mx',
+        # Sin porcentaje la tarjeta queda con descuento 0, para notar cuando lo pierde
+        'required': ['title', 'current_price'],
+        'id_pattern': (r'-p-(\d+)', 'SHEIN{0}'),
+        'pagination': {'param': 'page'},
+        'rate_limit': (1, 3),
+        # Ajustes por tienda, según un fragmento de la URL
+        'variants': {
+            # Pure and Simple: solo tarjetas de la lista y sin los colores al final del título
+            'store_code=7833912084': {
+                'card': 'section.product-card[role="listitem"]',
+                'title_separator': '|',
+            },
+        },
+    },
+}
+
+
+PRICE_NOISE = re.compile(r'[^\d.\x1f]')
+
+
+def parse_prices(texts):
+    # "$MXN1,234.50", "$1,234", "-35%" -> 1234.5, 1234.0, 35.0, sobre una
+    # columna completa: una sola pasada de la expresión regular y una sola
+    # conversión a float64. Los textos ausentes o sin un número válido quedan como NaN
+    if not texts:
+        return np.empty(0)
+    cleaned = PRICE_NOISE.sub('', '\x1f'.join(text or '' for text in texts)).split('\x1f')
+    try:
+        return np.array([value or 'nan' for value in cleaned], dtype=np.float64)
+    except ValueError:
+        values = np.full(len(cleaned), np.nan)
+        for i, value in enumerate(cleaned):
+            try:
+                values[i] = float(value)
+            except ValueError:
+                pass
+        return values
+
+
+def class_pattern(classes):
+    # Al filtrar durante el parseo, SoupStrainer puede comparar contra el
+    # atributo class completo ("product-card multiple-row-card"), así que
+    # cada clase se busca como palabra suelta
+    classes = [classes] if isinstance(classes, str) else classes
+    return re.compile(r'(?:^|\s)(?:' + '|'.join(map(re.escape, classes)) + r')(?:\s|$)')
+
+
+class PlatformExtractor:
+    # Especificación de una plataforma con sus selectores ya compilados, para
+    # no volver a interpretarlos en cada tarjeta
+    FIELDS = ('title', 'current_price', 'original_price', 'discount')
+
+    def __init__(self, platform, spec):
+        self.platform = platform
+        self.spec = spec
+        self.headers = spec['headers']
+        self.required = set(spec.get('required', ()))
+        self.default_title = spec.get('default_title')
+        self.title_separator = spec.get('title_separator')
+        self.link_prefix = spec.get('link_prefix', '')
+        self.url_attribute = spec.get('url_attribute')
+        self.discount_decimals = spec.get('discount_decimals')
+        pattern, self.id_template = spec['id_pattern']
+        self.id_pattern = re.compile(pattern)
+        self.pagination = spec['pagination']
+        self.block_marker = spec.get('block_marker')
+        self.variants = [
+            (marker, PlatformExtractor(platform, {**spec, **overrides, 'variants': {}}))
+            for marker, overrides in spec.get('variants', {}).items()
+        ]
+
+    # Los selectores se compilan la primera vez que se usan, no al importar el módulo
+    @cached_property
+    def strainer(self):
+        from bs4 import SoupStrainer
+        name, attrs = self.spec['strainer']
+        return SoupStrainer(name, attrs={
+            key: class_pattern(value) if key == 'class' else value for key, value in attrs.items()
+        })
+
+    @cached_property
+    def card(self):
+        import soupsieve
+        return soupsieve.compile(self.spec['card'])
+
+    @cached_property
+    def require(self):
+        import soupsieve
+        return soupsieve.compile(self.spec['require']) if self.spec.get('require') else None
+
+    @cached_property
+    def selectors(self):
+        import soupsieve
+        return {field: soupsieve.compile(self.spec[field]) for field in self.FIELDS + ('link',) if self.spec.get(field)}
+
+    def parse(self, html, parser=None):
+        # Solo las tarjetas de productos, ya filtradas durante el parseo
+        from bs4 import BeautifulSoup
+        return BeautifulSoup(html, parser or PARSER_BACKEND, parse_only=self.strainer)
+
+    def for_url(self, url):
+        for marker, variant in self.variants:
+            if marker in url:
+                return variant
+        return self
+
+    def cards(self, soup):
+        return self.card.select(soup)
+
+    def _text(self, card, field):
+        selector = self.selectors.get(field)
+        element = selector.select_one(card) if selector else None
+        return element.get_text().strip() if element else None
+
+    def _url(self, card):
+        if self.url_attribute:
+            value = card.get(self.url_attribute[0])
+            if value:
+                return self.url_attribute[1].format(value)
+        link = self.selectors['link'].select_one(card) if 'link' in self.selectors else None
+        url = link.get('href', '') if link else ''
+        if url and not url.startswith('http'):
+            url = f"{self.link_prefix}{url}"
+        return url
+
+    def product_id(self, url, title):
+        match = self.id_pattern.search(url)
+        return self.id_template.format(*match.groups()) if match else f"title:{title}"
+
+    def fields(self, card):
+        # Textos de la tarjeta como (título, precio actual, precio original,
+        # descuento, url), o None si no cumple el filtro o le falta un dato
+        # obligatorio. Los números se interpretan después, por lote
+        if self.require and self.require.select_one(card) is None:
+            return None
+        values = {field: self._text(card, field) for field in self.FIELDS}
+        if any(values[field] is None for field in self.required):
+            return None
+
+        title = values['title'] or self.default_title
+        if self.title_separator:
+            title = title.split(self.title_separator)[0].strip()
+        return title, values['current_price'], values['original_price'], values['discount'], self._url(card)
+
+    @staticmethod
+    def fingerprint(card):
+        # Huella del contenido de la tarjeta: texto y atributos de todas sus etiquetas.
+        # Calcularla cuesta una fracción de lo que cuesta extraer el producto
+        content = card.get_text('\x1f') + repr(card.attrs) + repr([tag.attrs for tag in card.find_all(True)])
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+
+    def extract_all(self, soup, metrics=None, previous=None):
+        # Devuelve (productos, {huella: producto}). Con `previous`, las huellas de
+        # la descarga anterior de la misma página, las tarjetas que no cambiaron
+        # reutilizan su producto en lugar de extraerse de nuevo. Las demás se
+        # leen tarjeta por tarjeta y se convierten en productos en un solo lote
+        entries = []  # (huella, producto reutilizado o posición en el lote)
+        rows = []
+        reused = 0
+        errors = 0
+        cards = self.cards(soup)
+        logging.info(f"Encontrados {len(cards)} productos en {self.platform}")
+        for card in cards:
+            try:
+                fingerprint = self.fingerprint(card)
+                if previous and fingerprint in previous:
+                    entries.append((fingerprint, previous[fingerprint]))
+                    reused += 1
+                    continue
+                fields = self.fields(card)
+            except Exception as e:
+                logging.error(f"Error procesando producto de {self.platform}: {str(e)}")
+                errors += 1
+                continue
+            if fields is None:
+                entries.append((fingerprint, None))
+            else:
+                entries.append((fingerprint, len(rows)))
+                rows.append(fields)
+
+        batch = ProductBatch(self, rows).products()
+        products = []
+        fingerprints = {}
+        for fingerprint, product in entries:
+            if isinstance(product, int):
+                position, product = product, batch[product]
+                if product is None:
+                    logging.error(f"Error procesando producto de {self.platform}: precio no válido en '{rows[position][0]}'")
+                    errors += 1
+                    continue
+            fingerprints[fingerprint] = product
+            if product:
+                products.append(product)
+        if metrics and errors:
+            metrics.inc('u4u_parse_errors_total', errors, platform=self.platform)
+        if metrics and reused:
+            metrics.inc('u4u_cards_reused_total', reused, platform=self.platform)
+        return products, fingerprints
+
+
+Product = namedtuple('Product', ['id', 'title', 'original_price', 'current_price', 'discount', 'url', 'platform'])
+
+
+class ProductBatch:
+    # Productos de una página en columnas: títulos, ids y URLs en listas, y
+    # precios y descuentos en arreglos de numpy que se calculan para todo el
+    # lote a la vez en lugar de tarjeta por tarjeta
+    __slots__ = ('platform', 'ids', 'titles', 'urls', 'original_price', 'current_price', 'discount', 'integral', 'valid')
+
+    def __init__(self, extractor, rows):
+        # rows: textos de PlatformExtractor.fields, uno por tarjeta
+        self.platform = extractor.platform
+        titles, current_texts, original_texts, discount_texts, urls = zip(*rows) if rows else ((),) * 5
+        self.titles = list(titles)
+        self.urls = list(urls)
+        self.ids = [extractor.product_id(url, title) for url, title in zip(urls, titles)]
+
+        has_current = np.array([bool(text) for text in current_texts], dtype=bool)
+        has_original = np.array([bool(text) for text in original_texts], dtype=bool)
+        # Shein solo muestra el porcentaje; el precio original se reconstruye
+        has_discount = np.array([text is not None for text in discount_texts], dtype=bool)
+        shown = parse_prices(discount_texts)
+        current = np.where(has_current, parse_prices(current_texts), 0.0)
+        listed = np.where(has_original, parse_prices(original_texts), current)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rebuilt = np.where(shown < 100, np.round(current / (1 - shown / 100), 2), current)
+            computed = np.where(
+                listed > current,
+                np.round((listed - current) / listed * 100, extractor.discount_decimals or 0),
+                0.0
+            )
+        self.current_price = current
+        self.original_price = np.where(has_discount, rebuilt, listed)
+        self.discount = np.where(has_discount, shown, computed)
+        # Sin decimales configurados, o sin descuento, el porcentaje calculado es entero
+        self.integral = ~has_discount & ((self.discount == 0) | (extractor.discount_decimals is None))
+        self.valid = ~(np.isnan(self.current_price) | np.isnan(self.original_price) | np.isnan(self.discount))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def products(self):
+        # Un Product por fila, en el orden del lote; None en las filas con un precio ilegible
+        discounts = [
+            int(discount) if integral else discount
+            for discount, integral in zip(self.discount.tolist(), self.integral.tolist())
+        ]
+        return [
+            Product(pid, title, original, current, discount, url, self.platform) if valid else None
+            for pid, title, original, current, discount, url, valid in zip(
+                self.ids, self.titles, self.original_price.tolist(), self.current_price.tolist(),
+                discounts, self.urls, self.valid.tolist()
+            )
+        ]
+
+
+EXTRACTORS = {platform: PlatformExtractor(platform, spec) for platform, spec in PLATFORM_SPECS.items()}
+
+
+def parse_listing(html, platform, parser=None):
+    return EXTRACTORS[platform].parse(html, parser)
+
+
+def page_url(account, page):
+    # URL de la página `page` (1 = la configurada) del listado de la cuenta
+    if page == 1:
+        return account.url
+    pagination = EXTRACTORS[account.platform].pagination
+    parts = urlsplit(account.url)
+    if 'offset_path' in pagination:
+        # Paginación por desplazamiento en la ruta, como Mercado Libre:
+        # /_CustId_123 -> /_CustId_123_Desde_49, /tienda/u4u -> /tienda/u4u/_Desde_49
+        marker = pagination['offset_path']
+        path = re.sub(re.escape(marker) + r'\d+', '', parts.path).rstrip('/')
+        offset = (page - 1) * pagination['page_size'] + 1
+        separator = '' if path.rsplit('/', 1)[-1].startswith('_') else '/'
+        return urlunsplit((parts.scheme, parts.netloc, f"{path}{separator}{marker}{offset}", parts.query, ''))
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key != pagination['param']]
+    query.append((pagination['param'], str(page)))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+
+def product_id(product):
+    # Identificador estable (MLM, ASIN o goods id de Shein); sin URL
+    # reconocible, el título es lo único que distingue al producto
+    return product.id or f"title:{product.title}"
+
+
+KnownProduct = namedtuple('KnownProduct', ['title', 'discount', 'original_price', 'current_price'])
+
+
+# Tipos de cambio que detecta la comparación entre ciclos
+NEW = 'new'
+REMOVED = 'removed'
+DISCOUNT_UP = 'discount_up'
+DISCOUNT_DOWN = 'discount_down'
+DISCOUNT_LOST = 'discount_lost'
+PRICE_CHANGED = 'price_changed'
+
+# product: Product del ciclo actual (None si se retiró);
+# previous: KnownProduct guardado (None si es nuevo)
+ChangeEvent = namedtuple('ChangeEvent', ['kind', 'account', 'platform', 'product_id', 'product', 'previous'])
+
+
+def diff_product(account, pid, product, previous):
+    # Evento de cambio del producto respecto a lo guardado, o None si sigue igual
+    kind = None
+    discount = product.discount
+    if previous is None:
+        kind = NEW
+    elif discount == 0 and previous.discount > 0:
+        kind = DISCOUNT_LOST
+    elif discount > previous.discount:
+        kind = DISCOUNT_UP
+    elif discount < previous.discount:
+        kind = DISCOUNT_DOWN
+    elif previous.current_price is not None and (product.current_price, product.original_price) != (previous.current_price, previous.original_price):
+        kind = PRICE_CHANGED
+    if kind is None:
+        return None
+    return ChangeEvent(kind, account.name, account.platform, pid, product, previous)
+
+
+def render_event(event):
+    # Texto del evento para el reporte; solo se arma para lo que se envía
+    if event.kind == REMOVED:
+        return f"\n🗑️ Producto retirado: {event.previous.title}\n"
+    product = event.product
+    if product.discount == 0:
+        # Un descuento perdido ya lo dice el encabezado; los demás cambios se anotan abajo
+        text = (
+            f"\n⚠️ PRODUCTO SIN DESCUENTO\n"
+            f"📦 Producto: {product.title}\n"
+            f"💰 Precio: ${product.original_price}\n"
+        )
+    else:
+        text = (
+            f"\n📦 Producto: {product.title}\n"
+            f"💰 Precio original: ${product.original_price}\n"
+            f"🏷️ Precio actual: ${product.current_price}\n"
+            f"📊 Descuento: {product.discount}%\n"
+        )
+    if event.kind == NEW:
+        text += "✨ (Nuevo producto)\n"
+    elif event.kind == DISCOUNT_DOWN:
+        text += f"📉 Descuento REDUCIDO: {event.previous.discount}% → {product.discount}%\n"
+    elif event.kind == DISCOUNT_UP:
+        text += f"📈 Descuento AUMENTADO: {event.previous.discount}% → {product.discount}%\n"
+    elif event.kind == PRICE_CHANGED:
+        text += f"💲 Precio actualizado: ${event.previous.current_price} → ${product.current_price}\n"
+    return text
+
+
+def render_urgent(events):
+    alerts = [
+        f"\n{'🚨'*5} ¡ALERTA URGENTE! {'🚨'*5}\n"
+        f"{'='*40}\n"
+        f"❌ PRODUCTO SIN DESCUENTO ❌\n"
+        f"📦 Producto: {event.product.title}\n"
+        f"💰 Precio actual: ${event.product.current_price}\n"
+        f"⚠️ ¡ACCIÓN INMEDIATA REQUERIDA!\n"
+        f"{'='*40}\n"
+        for event in events
+    ]
+    message = "🚨 ¡ALERTAS URGENTES! 🚨\n\n" + "\n\n".join(alerts)
+    return message + f"\n\n⏰ Alerta generada: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
+
+
+def render_report(accounts, events_by_account, first_run=False):
+    # Reporte con los eventos acumulados por cuenta, en el orden de `accounts`;
+    # None si no hay nada que reportar
+    sections = []
+    for account in accounts:
+        events = events_by_account.get(account.name)
+        if not events:
+            continue
+        parts = [f"🏪 {account.name.upper()} ({account.platform})\n{'='*30}\n"]
+        parts.extend(render_event(event) for event in events.values())
+        sections.append("".join(parts))
+    if not sections:
+        return None
+    header = "📊 REPORTE INICIAL DE PRODUCTOS 📊\n\n" if first_run else "📊 REPORTE PROGRAMADO 📊\n\n"
+    message = header + "\n\n".join(sections)
+    return message + f"\n\n⏰ Reporte generado: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
+
+
+# Palabras que aparecen en casi cualquier título y no distinguen un producto de otro
+TITLE_STOPWORDS = frozenset('a al con de del el en la las los para por sin y u4u uniforms'.split())
+TITLE_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def title_tokens(title):
+    # "U4U Uniforms Filipina Médica para Mujer | Azul" -> {'filipina', 'medica', 'mujer'}.
+    # Lo que va después de '|' es el color que Shein agrega al final
+    text = unicodedata.normalize('NFKD', title.split('|')[0].lower()).encode('ascii', 'ignore').decode('ascii')
+    return frozenset(token for token in TITLE_TOKEN.findall(text) if token not in TITLE_STOPWORDS)
+
+
+# Último precio conocido de un producto en una cuenta, para compararlo entre plataformas
+MatchEntry = namedtuple('MatchEntry', ['account', 'platform', 'product_id', 'title', 'discount', 'current_price'])
+Divergence = namedtuple('Divergence', ['product', 'other', 'reasons'])
+
+
+class ProductMatcher:
+    # Empareja el mismo producto publicado en plataformas distintas por la
+    # similitud (Jaccard) de los tokens de sus títulos. Un índice invertido
+    # token -> productos da los candidatos, así que cada búsqueda solo toca
+    # los productos que comparten algún token; los tokens que están en más de
+    # `common_share` del catálogo no generan candidatos (pero sí cuentan en
+    # la similitud), porque recorrerlos volvería la búsqueda cuadrática
+    def __init__(self, similarity=0.6, discount_gap=10, price_gap=0.15, common_share=0.05, common_min=50):
+        self.similarity = similarity
+        self.discount_gap = discount_gap  # Puntos porcentuales de descuento
+        self.price_gap = price_gap  # Diferencia relativa del precio actual
+        self.common_share = common_share
+        self.common_min = common_min
+        self.entries = {}  # (cuenta, product_id) -> MatchEntry
+        self.tokens = {}  # (cuenta, product_id) -> tokens del título
+        self.postings = defaultdict(set)  # token -> {(cuenta, product_id)}
+        self.by_account = defaultdict(set)
+        self.divergent = defaultdict(set)  # Parejas ya avisadas, en ambos sentidos
+        self.changes = {}  # Pareja -> True si se avisó, False si dejó de estar separada; para guardarlas
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update(self, entry):
+        # Devuelve si el producto es nuevo o cambió su título, precio o descuento;
+        # solo esos pueden haberse separado (o acercado) de sus parejas
+        key = (entry.account, entry.product_id)
+        previous = self.entries.get(key)
+        if previous is not None and previous[3:] == entry[3:]:
+            return False
+        if previous is None or previous.title != entry.title:
+            for token in self.tokens.get(key, ()):
+                self.postings[token].discard(key)
+            tokens = self.tokens[key] = title_tokens(entry.title)
+            for token in tokens:
+                self.postings[token].add(key)
+        self.entries[key] = entry
+        self.by_account[entry.account].add(key)
+        return True
+
+    def _mark(self, key, other, divergent):
+        pair = (key, other) if key < other else (other, key)
+        if divergent:
+            self.divergent[key].add(other)
+            self.divergent[other].add(key)
+        else:
+            self.divergent[key].discard(other)
+            self.divergent[other].discard(key)
+        self.changes[pair] = divergent
+
+    def load_divergent(self, pairs):
+        # Parejas avisadas en ejecuciones anteriores, para no repetir el aviso
+        for key, other in pairs:
+            self.divergent[key].add(other)
+            self.divergent[other].add(key)
+
+    def take_changes(self):
+        # (parejas avisadas, parejas que ya no lo están) desde la última llamada
+        changes, self.changes = self.changes, {}
+        added = [pair for pair, divergent in changes.items() if divergent]
+        cleared = [pair for pair, divergent in changes.items() if not divergent]
+        return added, cleared
+
+    def discard(self, key):
+        # Las parejas avisadas se sueltan aunque el producto no se haya visto
+        # desde que se cargaron de una ejecución anterior
+        for other in list(self.divergent.pop(key, ())):
+            self._mark(key, other, False)
+        if self.entries.pop(key, None) is None:
+            return
+        for token in self.tokens.pop(key):
+            self.postings[token].discard(key)
+        self.by_account[key[0]].discard(key)
+
+    def discard_account(self, account):
+        keys = self.by_account.pop(account, set()) | {key for key in self.divergent if key[0] == account}
+        for key in keys:
+            self.discard(key)
+
+    def matches(self, key):
+        # Productos de otras plataformas con un título lo bastante parecido
+        tokens = self.tokens.get(key)
+        if not tokens:
+            return []
+        platform = self.entries[key].platform
+        limit = max(self.common_min, len(self.entries) * self.common_share)
+        candidates = set()
+        for token in tokens:
+            posting = self.postings.get(token, ())
+            if len(posting) <= limit:
+                candidates.update(posting)
+        found = []
+        for other in candidates:
+            if self.entries[other].platform == platform:
+                continue
+            other_tokens = self.tokens[other]
+            shared = len(tokens & other_tokens)
+            if shared / (len(tokens) + len(other_tokens) - shared) >= self.similarity:
+                found.append(other)
+        return found
+
+    def compare(self, entry, other):
+        # Motivos por los que dos publicaciones del mismo producto no coinciden
+        reasons = []
+        if abs(entry.discount - other.discount) >= self.discount_gap:
+            reasons.append('discount')
+        low, high = sorted((entry.current_price, other.current_price))
+        if low > 0 and (high - low) / low > self.price_gap:
+            reasons.append('price')
+        return reasons
+
+    def divergences(self, keys):
+        # Parejas que acaban de separarse en precio o descuento, revisando solo
+        # los productos de `keys`. Una pareja se avisa una vez, y de nuevo solo
+        # si vuelve a coincidir y luego se separa otra vez
+        found = []
+        for key in keys:
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            matches = self.matches(key)
+            # Una pareja avisada cuyos títulos ya no se parecen deja de serlo; si
+            # la otra publicación no se ha visto (su tienda falló), se conserva
+            for other in self.divergent[key].difference(matches):
+                if other in self.entries:
+                    self._mark(key, other, False)
+            for other in matches:
+                reasons = self.compare(entry, self.entries[other])
+                if not reasons:
+                    if other in self.divergent[key]:
+                        self._mark(key, other, False)
+                elif other not in self.divergent[key]:
+                    self._mark(key, other, True)
+                    found.append(Divergence(entry, self.entries[other], reasons))
+        return found
+
+
+def render_divergences(divergences):
+    lines = []
+    for divergence in divergences:
+        lines.append(f"\n📦 Producto: {divergence.product.title}\n")
+        for entry in (divergence.product, divergence.other):
+            lines.append(f"   {entry.platform} ({entry.account}): ${entry.current_price}, descuento {entry.discount}%\n")
+    message = "🔀 PRECIOS DISTINTOS ENTRE PLATAFORMAS 🔀\n" + "".join(lines)
+    return message + f"\n⏰ Alerta generada: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
+
+
+class DiscountStateStore:
+    # Último descuento y precios conocidos de cada producto, guardados en SQLite
+    # para que sobrevivan a los reinicios. Las consultas van por la llave primaria
+    # (cuenta, producto) y cada ciclo escribe solo lo que cambió, en una sola transacción
+    LOOKUP_CHUNK = 500  # Por debajo del límite de parámetros de SQLite
+
+    def __init__(self, path='u4u_state.db', read_only=False):
+        if read_only and path != ':memory:':
+            # Simulación: se trabaja sobre una copia en memoria, así que ni la
+            # migración ni el modo WAL tocan el archivo
+            source = sqlite3.connect(f'file:{quote(path)}?mode=ro', uri=True)
+            self.conn = sqlite3.connect(':memory:')
+            source.backup(self.conn)
+            source.close()
+        else:
+            self.conn = sqlite3.connect(path)
+            if path != ':memory:':
+                self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS discounts (
+                account TEXT NOT NULL,
+                product_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                discount NUMERIC NOT NULL,
+                original_price REAL,
+                current_price REAL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (account, product_id)
+            ) WITHOUT ROWID
+        ''')
+        # Parejas del mismo producto en dos plataformas ya avisadas por precio o
+        # descuento distinto, guardadas una vez con (cuenta, producto) menor primero
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS divergences (
+                account_a TEXT NOT NULL,
+                product_a TEXT NOT NULL,
+                account_b TEXT NOT NULL,
+                product_b TEXT NOT NULL,
+                PRIMARY KEY (account_a, product_a, account_b, product_b)
+            ) WITHOUT ROWID
+        ''')
+        # Bases creadas antes de guardar precios
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(discounts)')}
+        for column in ('original_price', 'current_price'):
+            if column not in columns:
+                self.conn.execute(f'ALTER TABLE discounts ADD COLUMN {column} REAL')
+        self.conn.commit()
+
+    def is_empty(self):
+        return self.conn.execute('SELECT 1 FROM discounts LIMIT 1').fetchone() is None
+
+    def lookup(self, account, product_ids):
+        # Devuelve {product_id: KnownProduct} solo para los productos pedidos
+        product_ids = list(product_ids)
+        known = {}
+        for start in range(0, len(product_ids), self.LOOKUP_CHUNK):
+            chunk = product_ids[start:start + self.LOOKUP_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f'''SELECT product_id, title, discount, original_price, current_price FROM discounts
+                    WHERE account = ? AND product_id IN ({placeholders})''',
+                [account, *chunk]
+            )
+            known.update((row[0], KnownProduct(*row[1:])) for row in rows)
+        return known
+
+    def missing(self, account, seen_ids):
+        # Productos guardados de la cuenta que no aparecieron en `seen_ids`
+        rows = self.conn.execute(
+            'SELECT product_id, title, discount, original_price, current_price FROM discounts WHERE account = ?',
+            (account,)
+        )
+        return {row[0]: KnownProduct(*row[1:]) for row in rows if row[0] not in seen_ids}
+
+    def save_snapshot(self, rows, removed=()):
+        # rows: (cuenta, product_id, título, descuento, precio original, precio actual)
+        # de los productos nuevos o con cambios; removed: (cuenta, product_id)
+        updated_at = datetime.now().isoformat(timespec='seconds')
+        with self.conn:
+            self.conn.executemany(
+                '''INSERT INTO discounts (account, product_id, title, discount, original_price, current_price, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (account, product_id) DO UPDATE SET
+                       title = excluded.title, discount = excluded.discount, original_price = excluded.original_price,
+                       current_price = excluded.current_price, updated_at = excluded.updated_at''',
+                [(*row, updated_at) for row in rows]
+            )
+            self.conn.executemany('DELETE FROM discounts WHERE account = ? AND product_id = ?', removed)
+
+    def divergent_pairs(self):
+        rows = self.conn.execute('SELECT account_a, product_a, account_b, product_b FROM divergences')
+        return [((row[0], row[1]), (row[2], row[3])) for row in rows]
+
+    def save_divergences(self, added, cleared):
+        # added / cleared: parejas ((cuenta, producto), (cuenta, producto))
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO divergences (account_a, product_a, account_b, product_b) VALUES (?, ?, ?, ?)',
+                [(*a, *b) for a, b in added]
+            )
+            self.conn.executemany(
+                'DELETE FROM divergences WHERE account_a = ? AND product_a = ? AND account_b = ? AND product_b = ?',
+                [(*a, *b) for a, b in cleared]
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+class PriceHistory:
+    # Historial de precios por columnas: una carpeta por día con un archivo
+    # binario por columna, al que cada ciclo solo agrega filas al final.
+    # Productos y cuentas se guardan como códigos enteros (su posición en
+    # products.txt / accounts.txt) para que las columnas sean compactas y las
+    # consultas se resuelvan con operaciones de numpy sobre arreglos completos
+    COLUMNS = {
+        'ts': np.int64,
+        'product': np.uint32,
+        'account': np.uint16,
+        'original': np.float32,
+        'current': np.float32,
+        'discount': np.float32,
+    }
+
+    def __init__(self, root='u4u_history'):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.products = self._load_keys('products.txt')
+        self.accounts = self._load_keys('accounts.txt')
+        self.product_codes = {key: code for code, key in enumerate(self.products)}
+        self.account_codes = {key: code for code, key in enumerate(self.accounts)}
+
+    def _load_keys(self, name):
+        path = os.path.join(self.root, name)
+        if not os.path.exists(path):
+            return []
+        # Una clave por línea. Solo '\n' separa: splitlines() y los saltos
+        # universales también cortarían en '\r', '\x85' o '\u2028', que pueden venir en
+        # un título, y recorrerían los códigos de todas las claves siguientes
+        with open(path, encoding='utf-8', newline='') as f:
+            return f.read().split('\n')[:-1]
+
+    @staticmethod
+    def _key(key):
+        # La clave tal como queda guardada, para que coincida antes y después de reiniciar
+        return key.replace('\n', ' ')
+
+    def _code(self, key, keys, codes, name):
+        key = self._key(key)
+        code = codes.get(key)
+        if code is None:
+            code = codes[key] = len(keys)
+            keys.append(key)
+            with open(os.path.join(self.root, name), 'a', encoding='utf-8', newline='') as f:
+                f.write(key + '\n')
+        return code
+
+    def append(self, rows, timestamp=None):
+        # rows: (product_id, cuenta, precio original, precio actual, descuento)
+        if not rows:
+            return
+        timestamp = int(timestamp if timestamp is not None else time.time())
+        columns = {
+            'ts': np.full(len(rows), timestamp),
+            'product': [self._code(row[0], self.products, self.product_codes, 'products.txt') for row in rows],
+            'account': [self._code(row[1], self.accounts, self.account_codes, 'accounts.txt') for row in rows],
+            'original': [float(row[2]) for row in rows],
+            'current': [float(row[3]) for row in rows],
+            'discount': [float(row[4]) for row in rows],
         }
-        
-        try:
-            response = requests.get(account['url'], headers=headers)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            products = []
-            
-            # Detectar la plataforma basada en la URL
-            if 'shein.com' in account['url'] or 'shein.mx' in account['url']:
-                # Lógica para SHEIN
-                items = soup.find_all('section', class_='product-card')
-                logging.info(f"Encontrados {len(items)} productos en SHEIN")
-                
-                for item in items:
-                    try:
-                        title_elem = item.find('a', class_='goods-title-link')
-                        title = title_elem.get_text().strip() if title_elem else "Sin título"
-                        
-                        # Obtener precio original y con descuento
-                        price_wrapper = item.find('div', class_='product-card__price')
-                        if price_wrapper:
-                            current_price_elem = price_wrapper.find('span', class_='normal-price-ctn__sale-price')
-                            current_price = current_price_elem.get_text().strip() if current_price_elem else "0"
-                            
-                            # Buscar el descuento
-                            discount_elem = item.find('span', class_='discount-text')
-                            if discount_elem:
-                                discount = discount_elem.get_text().strip()
-                                # Convertir el descuento de texto (ej: "-71%") a número
-                                discount = int(discount.strip('-%'))
-                                # Calcular el precio original
-                                current_price_num = float(current_price.replace('$MXN', '').replace(',', '').strip())
-                                original_price = current_price_num / (1 - discount/100)
-                            else:
-                                original_price = float(current_price.replace('$MXN', '').replace(',', '').strip())
-                                discount = 0
-                            
-                            product_url = title_elem['href'] if title_elem else ""
-                            if not product_url.startswith('http'):
-                                product_url = f"https://www.shein.com{product_url}"
-                            
-                            products.append({
-                                'title': title,
-                                'original_price': original_price,
-                                'current_price': current_price_num,
-                                'discount': discount,
-                                'url': product_url
-                            })
-                    except Exception as e:
-                        logging.error(f"Error procesando producto de SHEIN: {str(e)}")
-                        continue
-                    
-            elif 'mercadolibre' in account['url']:
-                # Lógica existente para Mercado Libre
-                items = soup.find_all(['div', 'li'], class_=['ui-search-layout__item', 'ui-search-result'])
-                logging.info(f"Encontrados {len(items)} productos en Mercado Libre")
-                
-                for item in items:
-                    try:
-                        title_elem = item.find(['h2', 'h3'], class_='ui-search-item__title')
-                        title = title_elem.text.strip() if title_elem else "Sin título"
-                        
-                        price_elem = item.find('span', class_=['price-tag-amount', 'price-tag-fraction'])
-                        current_price = float(price_elem.text.replace('$', '').replace(',', '')) if price_elem else 0
-                        
-                        original_price_elem = item.find('span', class_='ui-search-price__second-line')
-                        original_price = current_price
-                        if original_price_elem:
-                            price_text = original_price_elem.find('span', class_=['price-tag-amount', 'price-tag-fraction'])
-                            if price_text:
-                                original_price = float(price_text.text.replace('$', '').replace(',', ''))
-                        
-                        url_elem = item.find('a', class_='ui-search-item__group__element')
-                        product_url = url_elem['href'] if url_elem else ""
-                        
-                        discount = round(((original_price - current_price) / original_price) * 100) if original_price > current_price else 0
-                        
-                        products.append({
-                            'title': title,
-                            'original_price': original_price,
-                            'current_price': current_price,
-                            'discount': discount,
-                            'url': product_url
-                        })
-                    except Exception as e:
-                        logging.error(f"Error procesando producto de Mercado Libre: {str(e)}")
-                        continue
-                    
-            elif 'amazon' in account['url']:
-                # Lógica existente para Amazon
-                items = soup.find_all('div', {'data-component-type': 's-search-result'})
-                logging.info(f"Encontrados {len(items)} productos en Amazon")
-                
-                for item in items:
-                    try:
-                        title_elem = item.find('h2', class_='a-size-mini')
-                        title = title_elem.text.strip() if title_elem else "Sin título"
-                        
-                        price_elem = item.find('span', class_='a-price')
-                        current_price = 0
-                        if price_elem:
-                            price_text = price_elem.find('span', class_='a-offscreen')
-                            if price_text:
-                                current_price = float(price_text.text.replace('$', '').replace(',', ''))
-                        
-                        original_price_elem = item.find('span', class_='a-text-price')
-                        original_price = current_price
-                        if original_price_elem:
-                            price_text = original_price_elem.find('span', class_='a-offscreen')
-                            if price_text:
-                                original_price = float(price_text.text.replace('$', '').replace(',', ''))
-                        
-                        url_elem = item.find('a', class_='a-link-normal')
-                        product_url = f"https://www.amazon.com.mx{url_elem['href']}" if url_elem else ""
-                        
-                        discount = round(((original_price - current_price) / original_price) * 100) if original_price > current_price else 0
-                        
-                        products.append({
-                            'title': title,
-                            'original_price': original_price,
-                            'current_price': current_price,
-                            'discount': discount,
-                            'url': product_url
-                        })
-                    except Exception as e:
-                        logging.error(f"Error procesando producto de Amazon: {str(e)}")
-                        continue
-            
-            logging.info(f"Total de productos encontrados: {len(products)}")
-            return products
-            
-        except Exception as e:
-            logging.error(f"Error al obtener productos: {str(e)}")
+        partition = os.path.join(self.root, datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d'))
+        os.makedirs(partition, exist_ok=True)
+        for name, dtype in self.COLUMNS.items():
+            with open(os.path.join(partition, name), 'ab') as f:
+                f.write(np.asarray(columns[name], dtype=dtype).tobytes())
+
+    def _column(self, partition, name, rows):
+        # Columna mapeada en memoria: solo se lee del disco lo que se toca. Con
+        # mmap directo en vez de np.memmap, porque abrir cientos de particiones
+        # diarias costaba más que la consulta misma
+        with open(os.path.join(partition, name), 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return np.frombuffer(mapped, dtype=self.COLUMNS[name], count=rows)
+
+    def _load(self, since=None, until=None, product=None):
+        # Une las particiones de los días pedidos; cada columna es un arreglo de numpy.
+        # Con `product` (su código) solo se lee completa la columna de productos y
+        # de las demás únicamente las filas de ese producto
+        first_day = since.strftime('%Y-%m-%d') if since else ''
+        last_day = until.strftime('%Y-%m-%d') if until else '9999-12-31'
+        days = sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name)) and first_day <= name <= last_day
+        )
+        parts = {name: [] for name in self.COLUMNS}
+        for day in days:
+            partition = os.path.join(self.root, day)
+            # Una escritura interrumpida puede dejar columnas más largas que otras
+            rows = min(os.path.getsize(os.path.join(partition, name)) // np.dtype(dtype).itemsize
+                       for name, dtype in self.COLUMNS.items())
+            if not rows:
+                continue
+            selected = slice(None)
+            if product is not None:
+                selected = np.flatnonzero(self._column(partition, 'product', rows) == product)
+                if not len(selected):
+                    continue
+            for name in self.COLUMNS:
+                parts[name].append(np.array(self._column(partition, name, rows)[selected]))
+        data = {name: np.concatenate(chunks) if chunks else np.empty(0, dtype=self.COLUMNS[name])
+                for name, chunks in parts.items()}
+        keep = np.ones(len(data['ts']), dtype=bool)
+        if since:
+            keep &= data['ts'] >= int(since.timestamp())
+        if until:
+            keep &= data['ts'] <= int(until.timestamp())
+        return {name: column[keep] for name, column in data.items()}
+
+    def timeline(self, product_id, since=None, until=None):
+        # [(fecha, cuenta, precio original, precio actual, descuento)] de un producto
+        code = self.product_codes.get(self._key(product_id))
+        if code is None:
             return []
+        data = self._load(since, until, product=code)
+        selected = np.argsort(data['ts'], kind='stable')
+        return [
+            (datetime.fromtimestamp(int(data['ts'][i])), self.accounts[data['account'][i]],
+             float(data['original'][i]), float(data['current'][i]), float(data['discount'][i]))
+            for i in selected
+        ]
 
-    def get_amazon_products(self, url):
-        try:
-            logging.info("Intentando obtener información de productos de Amazon...")
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'es-MX,es;q=0.8,en-US;q=0.5,en;q=0.3',
-                'Connection': 'keep-alive',
-            }
-            response = requests.get(url, headers=headers)
-            logging.info(f"Respuesta del servidor Amazon: {response.status_code}")
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            products = []
-            
+    def discount_losses(self, product_id, since=None, until=None, rows=None):
+        # Momentos en que el producto pasó de tener descuento a no tenerlo;
+        # `rows` reutiliza una línea de tiempo ya leída
+        if rows is None:
+            rows = self.timeline(product_id, since, until)
+        discounts = np.array([row[4] for row in rows])
+        lost = np.flatnonzero((discounts[:-1] > 0) & (discounts[1:] == 0)) + 1
+        return [rows[i][0] for i in lost]
 
-            
-            # Buscar productos de Amazon
-            items = soup.find_all('div', {'data-component-type': 's-search-result'})
-            
-            for item in items:
-                try:
-                    # Verificar si es un producto U4U Uniforms
-                    brand_element = item.find('span', string=lambda text: text and "U4U Uniforms" in text)
-                    if brand_element:
-                        # Obtener el título
-                        title_element = item.find('h2', {'class': 'a-size-mini'})
-                        if title_element:
-                            title = title_element.get_text().strip()
-                            
-                            # Buscar precio con descuento (precio actual)
-                            current_price_elem = item.find('span', {'class': 'a-price'})
-                            # Buscar precio original (precio de lista)
-                            original_price_elem = item.find('span', {'class': 'a-price a-text-price'})
-                            
-                            if original_price_elem and current_price_elem:
-                                # Extraer precios
-                                original_price = original_price_elem.find('span', {'class': 'a-offscreen'}).text
-                                current_price = current_price_elem.find('span', {'class': 'a-offscreen'}).text
-                                
-                                # Limpiar y convertir precios a números
-                                original = float(re.sub(r'[^\d.]', '', original_price))
-                                current = float(re.sub(r'[^\d.]', '', current_price))
-                                
-                                # Calcular descuento
-                                if original > 0:  # Evitar división por cero
-                                    discount = round(((original - current) / original) * 100, 2)
-                                    
-                                    products.append({
-                                        'title': title,
-                                        'discount': discount,
-                                        'original_price': str(original),
-                                        'current_price': str(current),
-                                        'platform': 'Amazon'
-                                    })
-                                    logging.info(f"Producto Amazon encontrado: {title} con descuento de {discount}%")
-                
-                except Exception as e:
-                    logging.error(f"Error procesando producto Amazon individual: {str(e)}")
-            
-            logging.info(f"Total de productos U4U encontrados en Amazon: {len(products)}")
-            return products
-        except Exception as e:
-            logging.error(f"Error al obtener información de Amazon: {str(e)}", exc_info=True)
+    def store_rollup(self, since=None, until=None):
+        # Resumen por cuenta: observaciones, productos distintos, descuento
+        # promedio/máximo y porcentaje de observaciones con descuento
+        data = self._load(since, until)
+        if not len(data['ts']):
             return []
+        accounts = data['account'].astype(np.int64)
+        size = len(self.accounts)
+        count = np.bincount(accounts, minlength=size)
+        discount_sum = np.bincount(accounts, weights=data['discount'], minlength=size)
+        discounted = np.bincount(accounts, weights=data['discount'] > 0, minlength=size)
+        max_discount = np.zeros(size)
+        np.maximum.at(max_discount, accounts, data['discount'])
+        pairs = np.unique(accounts * (len(self.products) + 1) + data['product'])
+        distinct = np.bincount(pairs // (len(self.products) + 1), minlength=size)
+        return [
+            {
+                'account': self.accounts[code],
+                'observations': int(count[code]),
+                'products': int(distinct[code]),
+                'avg_discount': round(float(discount_sum[code] / count[code]), 2),
+                'max_discount': round(float(max_discount[code]), 2),
+                'discounted_share': round(float(discounted[code] / count[code]) * 100, 1),
+            }
+            for code in np.flatnonzero(count)
+        ]
+
+
+Account = namedtuple('Account', ['name', 'url', 'platform', 'type'], defaults=[None])
+
+
+class AccountConfig:
+    # Cuentas y número de teléfono leídos de un archivo, o de todos los archivos
+    # de un directorio, en JSON, TOML o YAML. Cada archivo es una lista de
+    # cuentas o un objeto con `accounts` y `phone_number`. Todo se valida al
+    # cargar; si algo está mal, se conserva la configuración anterior
+    EXTENSIONS = ('.json', '.toml', '.yaml', '.yml')
+
+    def __init__(self, path):
+        self.path = path
+        self.accounts = {}  # nombre -> Account, en el orden de los archivos
+        self.phone_number = None
+        self._signature = None
+
+    def _files(self):
+        if os.path.isdir(self.path):
+            return sorted(
+                os.path.join(self.path, name) for name in os.listdir(self.path)
+                if name.endswith(self.EXTENSIONS) and not name.startswith('.')
+            )
+        return [self.path]
+
+    def signature(self):
+        # Cambia cuando se agrega, quita o modifica alguno de los archivos
+        signature = []
+        for path in self._files():
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    @staticmethod
+    def _read(path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        # TOML viene en la biblioteca estándar desde Python 3.11; YAML requiere PyYAML
+        if path.endswith('.toml'):
+            tomllib = optional_module('tomllib')
+            if tomllib is None:
+                raise ValueError(f"{path}: leer TOML requiere Python 3.11 o posterior")
+            return tomllib.loads(data.decode('utf-8'))
+        if path.endswith(('.yaml', '.yml')):
+            yaml = optional_module('yaml')
+            if yaml is None:
+                raise ValueError(f"{path}: leer YAML requiere PyYAML (pip install pyyaml)")
+            return yaml.load(data, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+        return json.loads(data)
+
+    @staticmethod
+    def _account(entry, where):
+        if not isinstance(entry, dict):
+            raise ValueError(f"{where}: se esperaba un objeto con name, url y platform")
+        unknown = entry.keys() - set(Account._fields)
+        if unknown:
+            raise ValueError(f"{where}: campos desconocidos {', '.join(sorted(unknown))}")
+        for field in ('name', 'url', 'platform'):
+            if not isinstance(entry.get(field), str) or not entry[field].strip():
+                raise ValueError(f"{where}: falta '{field}'")
+        if entry['platform'] not in PLATFORM_SPECS:
+            raise ValueError(f"{where}: plataforma desconocida '{entry['platform']}' (válidas: {', '.join(PLATFORM_SPECS)})")
+        if not entry['url'].startswith(('http://', 'https://')):
+            raise ValueError(f"{where}: la URL debe empezar con http:// o https://")
+        return Account(entry['name'].strip(), entry['url'].strip(), entry['platform'], entry.get('type'))
+
+    def load(self):
+        # Lee y valida todos los archivos; devuelve ({nombre: Account}, teléfono)
+        accounts = {}
+        phone_number = None
+        files = self._files()
+        if not files:
+            raise ValueError(f"No hay archivos de cuentas en {self.path}")
+        for path in files:
+            data = self._read(path)
+            if isinstance(data, list):
+                data = {'accounts': data}
+            if not isinstance(data, dict) or not isinstance(data.get('accounts', []), list):
+                raise ValueError(f"{path}: se esperaba una lista de cuentas o un objeto con 'accounts'")
+            if data.get('phone_number'):
+                if phone_number and str(data['phone_number']) != phone_number:
+                    raise ValueError(f"{path}: otro archivo define un número de teléfono distinto")
+                phone_number = str(data['phone_number'])
+            for index, entry in enumerate(data.get('accounts', [])):
+                account = self._account(entry, f"{path}, cuenta {index + 1}")
+                if account.name in accounts:
+                    raise ValueError(f"{path}: la cuenta '{account.name}' está repetida")
+                accounts[account.name] = account
+        return accounts, phone_number
+
+    def reload(self):
+        # Vuelve a leer solo si algún archivo cambió. Devuelve (agregadas,
+        # quitadas), donde una cuenta modificada aparece en ambas, o None si no
+        # hubo cambios. Si la nueva versión no es válida lanza ValueError y no
+        # se vuelve a intentar hasta que los archivos cambien otra vez
+        signature = self.signature()
+        if signature == self._signature:
+            return None
+        self._signature = signature
+        accounts, phone_number = self.load()
+        added = [account for name, account in accounts.items() if self.accounts.get(name) != account]
+        removed = [name for name, account in self.accounts.items() if accounts.get(name) != account]
+        self.accounts = accounts
+        self.phone_number = phone_number
+        return added, removed
+
+
+class AdaptiveScheduler:
+    # Cola de prioridad con la próxima revisión de cada cuenta. Cada cuenta
+    # tiene su propio intervalo: se acorta cuando la cuenta cambia, se alarga
+    # cuando se mantiene estable y se espacia de forma exponencial tras errores
+    def __init__(self, base_interval=3600, min_interval=600, max_interval=6 * 3600, jitter=0.1):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.accounts = {}
+        self.intervals = {}
+        self.failures = {}
+        self._queue = []  # (vence, secuencia, nombre)
+        self._entries = {}  # nombre -> secuencia vigente; las demás entradas de la cola se ignoran
+        self._sequence = itertools.count()
+
+    def add(self, account, delay=0):
+        name = account.name
+        self.accounts[name] = account
+        self.intervals.setdefault(name, self.base_interval)
+        self.failures.setdefault(name, 0)
+        self._push(name, delay)
+
+    def remove(self, name):
+        self.accounts.pop(name, None)
+        self.intervals.pop(name, None)
+        self.failures.pop(name, None)
+        self._entries.pop(name, None)
+
+    def _push(self, name, delay):
+        sequence = next(self._sequence)
+        self._entries[name] = sequence
+        heapq.heappush(self._queue, (time.time() + delay, sequence, name))
+
+    def _skip_stale(self):
+        while self._queue and self._entries.get(self._queue[0][2]) != self._queue[0][1]:
+            heapq.heappop(self._queue)
 
-    def get_shein_products(self, url):
+    def next_due(self):
+        self._skip_stale()
+        return self._queue[0][0] if self._queue else None
+
+    def pop_due(self, now=None):
+        # Saca de la cola todas las cuentas cuya revisión ya venció
+        now = now or time.time()
+        due = []
+        self._skip_stale()
+        while self._queue and self._queue[0][0] <= now:
+            _, _, name = heapq.heappop(self._queue)
+            self._entries.pop(name, None)
+            due.append(self.accounts[name])
+            self._skip_stale()
+        return due
+
+    def record(self, name, outcome):
+        # outcome: 'changed', 'stable' o 'error'
+        if name not in self.accounts:
+            return
+        interval = self.intervals[name]
+        if outcome == 'error':
+            self.failures[name] += 1
+            delay = min(self.min_interval * 2 ** self.failures[name], self.max_interval)
+        else:
+            self.failures[name] = 0
+            factor = 0.5 if outcome == 'changed' else 1.25
+            interval = min(max(interval * factor, self.min_interval), self.max_interval)
+            self.intervals[name] = delay = interval
+        # El desfase aleatorio evita que todas las cuentas venzan al mismo tiempo
+        delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        self._push(name, delay)
+        logging.info(f"Próxima revisión de {name} en {delay / 60:.0f} min ({outcome})")
+
+
+class Metrics:
+    # Contadores, medidores e histogramas en memoria. Registrar un valor es
+    # solo actualizar un diccionario bajo un candado, así que se puede dejar
+    # activo en producción. Se exponen en formato Prometheus o como JSON
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)  # (nombre, etiquetas) -> valor
+        self._gauges = {}
+        self._gauge_callbacks = {}  # nombre -> función que da el valor al momento de leerlo
+        self._histograms = {}  # (nombre, etiquetas) -> [conteos por cubeta..., suma, total]
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[self._key(name, labels)] += value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def gauge_callback(self, name, func):
+        self._gauge_callbacks[name] = func
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.BUCKETS) + 2)
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
         try:
-            logging.info("Intentando obtener información de productos de Shein...")
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'es-MX,es;q=0.8,en-US;q=0.5,en;q=0.3',
-                'Connection': 'keep-alive',
-            }
-            response = requests.get(url, headers=headers)
-            logging.info(f"Respuesta del servidor Shein: {response.status_code}")
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            products = []
-            
-            # Determinar si es Pure and Simple o Grupo Maquilero por la URL
-            is_pure_and_simple = 'store_code=7833912084' in url
-            
-            # Buscar productos según el tipo de tienda
-            if is_pure_and_simple:
-                items = soup.find_all('section', {'class': 'product-card', 'role': 'listitem'})
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def _read(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: list(value) for key, value in self._histograms.items()}
+        for name, func in self._gauge_callbacks.items():
+            gauges[(name, ())] = func()
+        return counters, gauges, histograms
+
+    def to_dict(self):
+        counters, gauges, histograms = self._read()
+
+        def entry(key, **values):
+            return {'name': key[0], 'labels': dict(key[1]), **values}
+
+        return {
+            'counters': [entry(key, value=value) for key, value in sorted(counters.items())],
+            'gauges': [entry(key, value=value) for key, value in sorted(gauges.items())],
+            'histograms': [
+                entry(key, count=histogram[-1], sum=round(histogram[-2], 6),
+                      buckets=dict(zip(map(str, self.BUCKETS), itertools.accumulate(histogram[:-2]))))
+                for key, histogram in sorted(histograms.items())
+            ],
+        }
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    def render_prometheus(self):
+        counters, gauges, histograms = self._read()
+
+        def labels_text(labels, **extra):
+            pairs = list(labels) + list(extra.items())
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+        lines = []
+        for kind, values in (('counter', counters), ('gauge', gauges)):
+            for name in sorted({key[0] for key in values}):
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{labels_text(key[1])} {value}" for key, value in sorted(values.items()) if key[0] == name)
+        for name in sorted({key[0] for key in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in sorted(histograms.items()):
+                if key[0] != name:
+                    continue
+                for bound, cumulative in zip(self.BUCKETS, itertools.accumulate(histogram[:-2])):
+                    lines.append(f"{name}_bucket{labels_text(key[1], le=bound)} {cumulative}")
+                lines.append(f"{name}_bucket{labels_text(key[1], le='+Inf')} {histogram[-1]}")
+                lines.append(f"{name}_sum{labels_text(key[1])} {histogram[-2]}")
+                lines.append(f"{name}_count{labels_text(key[1])} {histogram[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+def start_metrics_server(metrics, port, host='127.0.0.1'):
+    # /metrics en formato Prometheus y /metrics.json con el mismo contenido en JSON
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body = metrics.render_prometheus().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body = json.dumps(metrics.to_dict(), ensure_ascii=False).encode('utf-8')
+                content_type = 'application/json'
             else:
-                items = soup.find_all('section', {'class': 'product-card'})
-            
-            logging.info(f"Productos encontrados: {len(items)}")
-            
-            for item in items:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logging.info(f"Métricas disponibles en http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+class WhatsAppTransport:
+    def __init__(self, phone_number):
+        self.phone_number = phone_number
+
+    def send(self, message):
+        # pywhatkit carga la automatización del navegador y falla sin pantalla,
+        # así que se importa hasta el primer envío
+        import pywhatkit
+        clean_number = self.phone_number.replace('+52 1 ', '')
+        pywhatkit.sendwhatmsg_instantly(
+            f"+521{clean_number}",
+            message,
+            10,  # Tiempo de espera reducido
+            tab_close=False  # No cerrar la pestaña para asegurar el envío
+        )
+        time.sleep(5)  # Pequeña pausa después de enviar
+
+
+class FileTransport:
+    # Escribe cada mensaje en un archivo local; útil para pruebas
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, message):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(f"{message}\n{'-' * 40}\n")
+
+
+class ConsoleTransport:
+    # Imprime cada mensaje en la salida estándar; para --dry-run
+    def send(self, message):
+        print(f"{message}\n{'-' * 40}", flush=True)
+
+
+class WebhookTransport:
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, message):
+        requests.post(self.url, json={'text': message}, timeout=self.timeout).raise_for_status()
+
+
+def split_message(message, max_length):
+    # Parte un mensaje largo en bloques de hasta max_length caracteres,
+    # cortando en saltos de línea siempre que se pueda
+    chunks = []
+    current = ''
+    for line in message.splitlines(keepends=True):
+        while len(line) > max_length:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:max_length])
+            line = line[max_length:]
+        if len(current) + len(line) > max_length:
+            chunks.append(current)
+            current = ''
+        current += line
+    if current:
+        chunks.append(current)
+    return [chunk.strip('\n') for chunk in chunks if chunk.strip()]
+
+
+class NotificationDispatcher:
+    # Cola de notificaciones atendida por un hilo propio, para que el scraping
+    # nunca espere a WhatsApp. Los mensajes que llegan dentro de la misma
+    # ventana se envían juntos, los muy largos se parten y los envíos fallidos
+    # se reintentan con espera exponencial
+    def __init__(self, transport, batch_window=30, max_length=4096, max_retries=4, retry_delay=5, metrics=None):
+        self.transport = transport
+        self.batch_window = batch_window
+        self.max_length = max_length
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue()
+        self.metrics = metrics or Metrics()
+        self.metrics.gauge_callback('u4u_notification_queue_depth', self.depth)
+        self._thread = threading.Thread(target=self._run, name='notifier', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, message):
+        if not message.strip():
+            logging.warning("Mensaje vacío, no se enviará")
+            return
+        self._queue.put(message)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            message = self._queue.get()
+            if message is None:
+                break
+            batch = [message]
+            deadline = time.monotonic() + self.batch_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
                 try:
-                    # Obtener el título según el tipo de tienda
-                    if is_pure_and_simple:
-                        title_elem = item.find('a', {'class': 'goods-title-link'})
-                        if title_elem:
-                            title = title_elem.text.strip()
-                            # Limpiar el título para quitar la parte de colores al final
-                            if '|' in title:
-                                title = title.split('|')[0].strip()
-                    else:
-                        title_elem = item.find('a', {'class': 'goods-title-link'})
-                        if title_elem:
-                            title = title_elem.text.strip()
-                    
-                    if title_elem:
-                        # Buscar el descuento
-                        discount_elem = item.find('span', {'class': 'discount-text'})
-                        if discount_elem:
-                            discount_text = discount_elem.text.strip()
-                            discount = float(re.sub(r'[^\d.]', '', discount_text))
-                            
-                            # Buscar precio actual
-                            current_price_elem = item.find('span', {'class': 'normal-price-ctn__sale-price'})
-                            if current_price_elem:
-                                price_span = current_price_elem.find('span')
-                                if price_span:
-                                    price_text = price_span.text.strip()
-                                    # Limpiar el texto del precio (quitar MXN y espacios)
-                                    current_price = re.sub(r'[^\d.]', '', price_text.replace('MXN', ''))
-                                    
-                                    # Convertir a números y calcular precio original
-                                    try:
-                                        current = float(current_price)
-                                        original = round(current / (1 - discount/100), 2)
-                                        
-                                        products.append({
-                                            'title': title,
-                                            'discount': discount,
-                                            'original_price': str(original),
-                                            'current_price': str(current)
-                                        })
-                                        logging.info(f"Producto Shein encontrado: {title} con descuento de {discount}%")
-                                    except ValueError as ve:
-                                        logging.error(f"Error convirtiendo precios para {title}: {str(ve)}")
-                
-                except Exception as e:
-                    logging.error(f"Error procesando producto Shein individual: {str(e)}")
-            
-            logging.info(f"Total de productos encontrados en Shein: {len(products)}")
-            return products
-        except Exception as e:
-            logging.error(f"Error al obtener información de Shein: {str(e)}", exc_info=True)
-            return []
+                    message = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if message is None:
+                    stopping = True
+                    break
+                batch.append(message)
+            if len(batch) > 1:
+                logging.info(f"Agrupando {len(batch)} mensajes en un solo envío")
+            for chunk in split_message("\n\n".join(batch), self.max_length):
+                self._deliver(chunk)
 
-    def send_whatsapp_message(self, message):
+    def _deliver(self, message):
+        for attempt in range(self.max_retries + 1):
+            try:
+                logging.info("Intentando enviar mensaje consolidado")
+                with self.metrics.timer('u4u_stage_seconds', stage='notify', platform='-'):
+                    self.transport.send(message)
+                logging.info("Mensaje enviado exitosamente")
+                self.metrics.inc('u4u_notifications_total', result='sent')
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logging.error(f"Error al enviar mensaje tras {attempt + 1} intentos: {str(e)}", exc_info=True)
+                    self.metrics.inc('u4u_notifications_total', result='failed')
+                    return
+                self.metrics.inc('u4u_notifications_total', result='retried')
+                delay = self.retry_delay * 2 ** attempt
+                logging.warning(f"Error al enviar mensaje ({str(e)}), reintentando en {delay}s")
+                time.sleep(delay)
+
+    def close(self, timeout=None):
+        # Envía lo pendiente y detiene el hilo
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+class ResponseCache:
+    # Páginas recién descargadas en memoria, de la más a la menos usada. Una URL
+    # que se pide otra vez dentro de `ttl` segundos (otra cuenta con la misma
+    # página, o un reintento tras un error) no vuelve a la red, y si dos hilos
+    # la piden a la vez solo uno la descarga. Se desalojan las menos usadas en
+    # cuanto el total de cuerpos pasa de `max_bytes`
+    def __init__(self, ttl=120, max_bytes=64 * 2**20):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # url -> (guardada, cuerpo, encabezados, codificación)
+        self._inflight = {}  # url -> [candado, hilos esperando]
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        # Respuesta reconstruida desde la memoria, o None si no hay o ya venció
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            stored_at, body, headers, encoding = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[url]
+                self.size -= len(body)
+                return None
+            self._entries.move_to_end(url)
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = url
+        response._content = body
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = encoding
+        return response
+
+    def put(self, url, response):
+        body = response.content
+        if len(body) > self.max_bytes:
+            return
+        headers = {key: response.headers[key] for key in ('Content-Type', 'ETag', 'Last-Modified') if key in response.headers}
+        with self._lock:
+            previous = self._entries.pop(url, None)
+            if previous:
+                self.size -= len(previous[1])
+            self._entries[url] = (time.monotonic(), body, headers, response.encoding)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted[1])
+
+    def touch(self, url):
+        # El servidor confirmó (304) que la copia sigue vigente
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry:
+                self._entries[url] = (time.monotonic(), *entry[1:])
+                self._entries.move_to_end(url)
+
+    def discard(self, url):
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry:
+                self.size -= len(entry[1])
+
+    @contextmanager
+    def fetching(self, url):
+        # Solo un hilo descarga cada URL a la vez; los demás esperan aquí y
+        # después encuentran la página en la memoria
+        with self._lock:
+            slot = self._inflight.setdefault(url, [threading.Lock(), 0])
+            slot[1] += 1
         try:
-            logging.info("Intentando enviar mensaje consolidado")
-            clean_number = self.phone_number.replace('+52 1 ', '')
-            
-            # Asegurarnos que el mensaje no esté vacío
-            if not message.strip():
-                logging.warning("Mensaje vacío, no se enviará")
+            with slot[0]:
+                yield
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if not slot[1]:
+                    del self._inflight[url]
+
+
+class SnapshotStore:
+    # Copia comprimida en disco de cada página descargada, para volver a
+    # parsear un ciclo sin tocar las tiendas. Cada cuerpo distinto se guarda una
+    # sola vez en objects/ y cada ciclo tiene en cycles/ un índice JSON por
+    # línea con URL, cuenta, hora y cuerpo. Al pasar de `max_bytes` se borran
+    # los ciclos más viejos junto con los cuerpos que solo ellos usaban.
+    # Mientras el ciclo está abierto su índice se llama .jsonl.part; así otro
+    # proceso que comparta el directorio no lo borra a medio escribir
+    EXTENSIONS = {'zstd': '.zst', 'gzip': '.gz'}
+    OPEN_SUFFIX = '.part'
+
+    def __init__(self, root='u4u_snapshots', max_bytes=512 * 2**20, compression=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        # zstd, si está instalado zstandard, es más rápido y comprime más que gzip
+        self.compression = compression or ('zstd' if importlib.util.find_spec('zstandard') else 'gzip')
+        if self.compression == 'zstd' and optional_module('zstandard') is None:
+            raise ValueError("La compresión zstd requiere el módulo zstandard (pip install zstandard)")
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'cycles'), exist_ok=True)
+        self._last_object = {}  # url -> último cuerpo guardado, para anotar los 304
+        self._index = None
+        self._index_path = None
+        self._lock = threading.Lock()
+
+    def _compress(self, body):
+        if self.compression == 'zstd':
+            return optional_module('zstandard').ZstdCompressor(level=10).compress(body)
+        return gzip.compress(body, compresslevel=6)
+
+    @staticmethod
+    def _decompress(path, data):
+        if path.endswith('.zst'):
+            zstandard = optional_module('zstandard')
+            if zstandard is None:
+                raise ValueError(f"{path}: leer zstd requiere el módulo zstandard")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def start_cycle(self):
+        # Cada proceso escribe su propio índice, así que varios trabajadores
+        # pueden compartir el mismo directorio
+        name = f"{datetime.now().strftime('%Y%m%dT%H%M%S.%f')}-{os.getpid()}.jsonl"
+        with self._lock:
+            self._close_index()
+            self._index_path = os.path.join(self.root, 'cycles', name)
+            self._index = open(self._index_path + self.OPEN_SUFFIX, 'a', encoding='utf-8', buffering=1)
+
+    def _close_index(self):
+        if self._index:
+            self._index.close()
+            os.replace(self._index_path + self.OPEN_SUFFIX, self._index_path)
+            self._index = None
+
+    def _write_object(self, path, body):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(self._compress(body))
+        os.replace(temporary, path)
+
+    def record(self, account, url, response):
+        # Guarda el cuerpo si es nuevo y lo anota en el índice del ciclo. Un 304
+        # apunta al último cuerpo guardado de la misma URL
+        if response.status_code == 304:
+            if url not in self._last_object:
                 return
-                
-            # Enviar mensaje por WhatsApp
-            pywhatkit.sendwhatmsg_instantly(
-                f"+521{clean_number}",
-                message,
-                10,  # Tiempo de espera reducido
-                tab_close=False  # No cerrar la pestaña para asegurar el envío
+            obj, encoding = self._last_object[url]
+            body = None
+        else:
+            body = response.content
+            digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+            obj = f"{digest[:2]}/{digest}{self.EXTENSIONS[self.compression]}"
+            if not os.path.exists(os.path.join(self.root, 'objects', obj)):
+                self._write_object(os.path.join(self.root, 'objects', obj), body)
+            encoding = response.encoding
+            self._last_object[url] = (obj, encoding)
+        entry = {
+            'fetched_at': datetime.now().isoformat(timespec='seconds'),
+            'account': account.name,
+            'platform': account.platform,
+            'url': url,
+            'status': response.status_code,
+            'encoding': encoding,
+            'object': obj,
+        }
+        with self._lock:
+            if self._index:
+                self._index.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        # El cuerpo ya existente se marca como recién usado después de anotarlo:
+        # evict no borra cuerpos modificados después de empezar, y si otro
+        # proceso lo borró antes, se vuelve a escribir
+        path = os.path.join(self.root, 'objects', obj)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            if body is None:
+                self._last_object.pop(url, None)
+            else:
+                self._write_object(path, body)
+
+    def end_cycle(self):
+        with self._lock:
+            self._close_index()
+        self.evict()
+
+    def cycles(self):
+        # Solo los ciclos terminados
+        return sorted(name[:-len('.jsonl')] for name in os.listdir(os.path.join(self.root, 'cycles')) if name.endswith('.jsonl'))
+
+    def entries(self, cycle):
+        return self._read_index(os.path.join(self.root, 'cycles', f'{cycle}.jsonl'))
+
+    @staticmethod
+    def _read_index(path):
+        # Un índice que otro proceso está escribiendo puede terminar en una
+        # línea a medias; esa línea se ignora
+        entries = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+        return entries
+
+    def body(self, entry):
+        path = os.path.join(self.root, 'objects', entry['object'])
+        with open(path, 'rb') as f:
+            return self._decompress(path, f.read())
+
+    def _disk_usage(self):
+        total = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass  # Otro proceso lo borró mientras se recorría
+        return total
+
+    def evict(self):
+        # Solo se borran ciclos terminados, pero los cuerpos que usan los
+        # índices abiertos (de este u otros procesos) también cuentan como
+        # referencias. Otro proceso puede estar borrando a la vez, así que los
+        # archivos que ya no existen se saltan
+        started = time.time() - 2  # Margen por la resolución de la hora de modificación
+        total = self._disk_usage()
+        if total <= self.max_bytes:
+            return
+        cycles_dir = os.path.join(self.root, 'cycles')
+        references = Counter()
+        objects = {}
+        for name in os.listdir(cycles_dir):
+            if not name.endswith(('.jsonl', '.jsonl' + self.OPEN_SUFFIX)):
+                continue
+            try:
+                used = {entry['object'] for entry in self._read_index(os.path.join(cycles_dir, name))}
+            except FileNotFoundError:
+                continue
+            references.update(used)
+            if name.endswith('.jsonl'):
+                objects[name[:-len('.jsonl')]] = used
+        # El ciclo terminado más reciente se conserva siempre
+        for cycle in sorted(objects)[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                index_path = os.path.join(cycles_dir, f'{cycle}.jsonl')
+                size = os.path.getsize(index_path)
+                os.remove(index_path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            for obj in objects[cycle]:
+                references[obj] -= 1
+                if references[obj] > 0:
+                    continue
+                path = os.path.join(self.root, 'objects', obj)
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime >= started:
+                        continue  # Otro proceso lo acaba de anotar en su ciclo
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                total -= stat.st_size
+            logging.info(f"Ciclo {cycle} borrado de {self.root} para no pasar de {self.max_bytes / 2**20:.0f} MB")
+
+
+class CircuitOpenError(requests.RequestException):
+    # El host está en pausa por fallas repetidas; la solicitud no se hizo
+    pass
+
+
+class BlockedError(requests.RequestException):
+    # El host respondió con una página de bloqueo (captcha) en lugar del listado
+    pass
+
+
+class TokenBucket:
+    # En promedio `rate` solicitudes por segundo, con ráfagas de hasta `burst`.
+    # Cada llamada reserva su turno y duerme hasta que le toca
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Devuelve los segundos que hubo que esperar
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    # Tras `threshold` fallas seguidas de un host deja de llamarlo. Pasado el
+    # enfriamiento deja pasar una sola solicitud de prueba: si sale bien el host
+    # vuelve a la normalidad, y si falla el enfriamiento se duplica
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2  # Valores del medidor u4u_circuit_state
+
+    def __init__(self, host, threshold=5, cooldown=60, max_cooldown=1800, metrics=None):
+        self.host = host
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.metrics = metrics or Metrics()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        self.state = state
+        self.metrics.set_gauge('u4u_circuit_state', state, host=self.host)
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self._set_state(self.HALF_OPEN)
+                logging.info(f"Probando de nuevo {self.host}")
+                return True  # Quien llega primero hace la prueba; los demás esperan su resultado
+            return False
+
+    def retry_in(self):
+        return max(self.opened_at + self.cooldown - time.monotonic(), 0)
+
+    def success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logging.info(f"{self.host} respondió bien, se reanudan las solicitudes")
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+            self._set_state(self.CLOSED)
+
+    def failure(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            else:
+                self.failures += 1
+                if self.failures < self.threshold or self.state == self.OPEN:
+                    return
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+            logging.warning(f"{self.host} en pausa por {self.cooldown:.0f}s tras fallas repetidas")
+
+
+class FetchEngine:
+    # Descarga páginas en paralelo con un límite de conexiones simultáneas por
+    # host, para no saturar a ninguna tienda. Cada plataforma usa su propia
+    # sesión con conexiones persistentes, las páginas ya vistas se revalidan
+    # con ETag/Last-Modified y las recién descargadas se sirven desde `cache`
+    # mientras no venzan. Cada host tiene además su propio ritmo máximo, sus
+    # reintentos y su interruptor, y su propio grupo de hilos, así que un host
+    # lento o caído no ocupa los hilos de los demás. `max_workers` limita las
+    # tareas corriendo a la vez entre todos los hosts
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    FAILURE_STATUSES = {403, 429}  # Además de los 5xx: bloqueos y exceso de solicitudes
+
+    def __init__(self, max_workers=8, per_host=2, metrics=None, cache=None, timeout=(5, 20),
+                 max_retries=2, backoff=1.0, rate_limits=None, breaker_threshold=5, breaker_cooldown=60):
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.metrics = metrics or Metrics()
+        self.cache = cache
+        self.timeout = timeout  # (conexión, lectura) en segundos
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limits = rate_limits or {}  # plataforma -> (solicitudes por segundo, ráfaga)
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch')
+        self._host_executors = {}
+        self._slots = threading.BoundedSemaphore(max(max_workers, 1))  # Compartido por todos los grupos
+        self._host_limits = {}
+        self._buckets = {}
+        self._breakers = {}
+        self._sessions = {}
+        self._validators = {}  # url -> (ETag, Last-Modified)
+        self._stats = {'requests': 0, 'not_modified': 0, 'bytes': 0}
+        self._connections_seen = 0
+        self._lock = threading.Lock()
+
+    def _session(self, platform):
+        with self._lock:
+            session = self._sessions.get(platform)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(self.per_host, 1))
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                # gzip/deflate siempre, y brotli si el módulo está instalado
+                session.headers['Accept-Encoding'] = make_headers(accept_encoding=True)['accept-encoding']
+                self._sessions[platform] = session
+            return session
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_limits[host]
+
+    def _bucket(self, host, platform):
+        with self._lock:
+            if host not in self._buckets:
+                limit = self.rate_limits.get(platform)
+                self._buckets[host] = TokenBucket(*limit) if limit else None
+            return self._buckets[host]
+
+    def breaker(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(host, self.breaker_threshold, self.breaker_cooldown,
+                                                      metrics=self.metrics)
+            return self._breakers[host]
+
+    def get(self, url, headers=None, platform='default', conditional=False, block_marker=None):
+        if self.cache is None:
+            return self._fetch(url, headers, platform, conditional, block_marker)
+        response = self.cache.get(url)
+        if response is None:
+            with self.cache.fetching(url):
+                # Otro hilo pudo haberla descargado mientras se esperaba
+                response = self.cache.get(url)
+                if response is None:
+                    self.metrics.inc('u4u_cache_total', platform=platform, result='miss')
+                    response = self._fetch(url, headers, platform, conditional, block_marker)
+                    if response.status_code == 304:
+                        self.cache.touch(url)
+                    elif response.ok:
+                        self.cache.put(url, response)
+                    return response
+        self.metrics.inc('u4u_cache_total', platform=platform, result='hit')
+        return response
+
+    def _retry_delay(self, attempt, response):
+        # Espera exponencial con desfase aleatorio; si el servidor indica
+        # Retry-After se respeta, hasta un máximo de un minuto
+        delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+        retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+        if retry_after.isdigit():
+            delay = max(delay, min(int(retry_after), 60))
+        return delay
+
+    def _fetch(self, url, headers, platform, conditional, block_marker=None):
+        host = urlsplit(url).netloc
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            self.metrics.inc('u4u_requests_skipped_total', platform=platform)
+            raise CircuitOpenError(f"{host} en pausa por fallas repetidas, se reintentará en {breaker.retry_in():.0f}s")
+        request_headers = dict(headers or {})
+        if conditional:
+            etag, last_modified = self._validators.get(url, (None, None))
+            if etag:
+                request_headers['If-None-Match'] = etag
+            if last_modified:
+                request_headers['If-Modified-Since'] = last_modified
+        bucket = self._bucket(host, platform)
+        
+        failed = True
+        try:
+            for attempt in range(self.max_retries + 1):
+                if bucket:
+                    waited = bucket.acquire()
+                    if waited:
+                        self.metrics.observe('u4u_stage_seconds', waited, stage='rate_limit_wait', platform=platform)
+                error = response = None
+                try:
+                    with self._host_limit(url):
+                        start = time.perf_counter()
+                        response = self._session(platform).get(url, headers=request_headers, timeout=self.timeout)
+                        elapsed = time.perf_counter() - start
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+                else:
+                    self._record(response, elapsed, platform)
+                if error is None and response.status_code not in self.RETRY_STATUSES:
+                    break
+                if attempt == self.max_retries:
+                    break
+                delay = self._retry_delay(attempt, response)
+                reason = type(error).__name__ if error else str(response.status_code)
+                self.metrics.inc('u4u_retries_total', platform=platform, reason=reason)
+                logging.warning(f"{url}: {error or response.status_code}, reintento {attempt + 1} de {self.max_retries} en {delay:.1f}s")
+                time.sleep(delay)
+            if error is not None:
+                raise error
+            if response.status_code in self.FAILURE_STATUSES or response.status_code >= 500:
+                return response
+            if block_marker and response.ok and block_marker.encode('utf-8') in response.content:
+                raise BlockedError(f"{host} respondió con una página de bloqueo", response=response)
+            failed = False
+        finally:
+            # Cualquier salida sin respuesta útil cuenta como falla del host
+            if failed:
+                breaker.failure()
+            else:
+                breaker.success()
+        
+        with self._lock:
+            if response.ok and response.status_code != 304:
+                validators = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+                if any(validators):
+                    self._validators[url] = validators
+        return response
+
+    def _record(self, response, elapsed, platform):
+        # Bytes realmente transferidos (comprimidos), no el tamaño del HTML decodificado
+        wire_bytes = response.raw.tell() if hasattr(response.raw, 'tell') else len(response.content)
+        # response.elapsed llega hasta los encabezados (DNS, conexión y espera del
+        # servidor); lo que resta es la descarga del cuerpo
+        self.metrics.observe('u4u_stage_seconds', response.elapsed.total_seconds(), stage='connect_wait', platform=platform)
+        self.metrics.observe('u4u_stage_seconds', max(elapsed - response.elapsed.total_seconds(), 0), stage='download', platform=platform)
+        self.metrics.inc('u4u_requests_total', platform=platform, status=response.status_code)
+        self.metrics.inc('u4u_bytes_downloaded_total', wire_bytes, platform=platform)
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['bytes'] += wire_bytes
+            if response.status_code == 304:
+                self._stats['not_modified'] += 1
+
+    def forget(self, url):
+        # Evita revalidar una página cuyo contenido no se pudo aprovechar
+        with self._lock:
+            self._validators.pop(url, None)
+        if self.cache:
+            self.cache.discard(url)
+
+    def _open_connections(self):
+        total = 0
+        for session in self._sessions.values():
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                total += sum(pools[key].num_connections for key in pools.keys())
+        return total
+
+    def cycle_stats(self):
+        # Devuelve y reinicia los contadores del ciclo actual
+        with self._lock:
+            connections = self._open_connections()
+            stats = dict(self._stats)
+            stats['new_connections'] = connections - self._connections_seen
+            stats['handshakes_saved'] = max(stats['requests'] - stats['new_connections'], 0)
+            self._connections_seen = connections
+            self._stats = {'requests': 0, 'not_modified': 0, 'bytes': 0}
+        return stats
+
+    def _run(self, func, *args):
+        with self._slots:
+            return func(*args)
+
+    def submit(self, func, *args, host=None):
+        # Con `host`, la tarea corre en el grupo de hilos de ese host. En
+        # cualquier caso espera un lugar entre los `max_workers` globales
+        if host is None:
+            return self._executor.submit(self._run, func, *args)
+        with self._lock:
+            executor = self._host_executors.get(host)
+            if executor is None:
+                executor = self._host_executors[host] = ThreadPoolExecutor(
+                    max_workers=max(min(self.per_host, self.max_workers), 1), thread_name_prefix=f'fetch-{host}'
+                )
+        return executor.submit(self._run, func, *args)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        for executor in self._host_executors.values():
+            executor.shutdown(wait=True)
+        for session in self._sessions.values():
+            session.close()
+
+
+class JobQueue:
+    # Tabla de trabajos en SQLite compartida por el coordinador y los procesos
+    # trabajadores, del mismo equipo o de otros que vean el archivo. Cada
+    # trabajo lleva el fragmento de su cuenta y cada trabajador atiende sus
+    # propios fragmentos. Un trabajo tomado que no se completa en `lease`
+    # segundos vuelve a quedar disponible
+    def __init__(self, path='u4u_jobs.db', lease=300):
+        self.lease = lease
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                cycle INTEGER NOT NULL,
+                account TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                claimed_at REAL,
+                result TEXT,
+                PRIMARY KEY (cycle, account)
             )
-            logging.info("Mensaje enviado exitosamente")
-            time.sleep(5)  # Pequeña pausa después de enviar
-        except Exception as e:
-            logging.error(f"Error al enviar mensaje: {str(e)}", exc_info=True)
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, shard)')
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE toma el candado de escritura desde el inicio, para que
+        # dos trabajadores no tomen el mismo trabajo
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def submit(self, assignments):
+        # assignments: (cuenta, fragmento). Crea un trabajo por cuenta y
+        # devuelve el identificador del ciclo
+        cycle = time.time_ns()
+        with self._transaction():
+            self.conn.executemany(
+                'INSERT INTO jobs (cycle, account, shard, payload) VALUES (?, ?, ?, ?)',
+                [(cycle, account.name, shard, json.dumps(account._asdict())) for account, shard in assignments]
+            )
+        return cycle
+
+    def claim(self, worker, shards=None, limit=1):
+        # Toma hasta `limit` trabajos pendientes o vencidos de los fragmentos
+        # indicados (todos si es None); devuelve [((ciclo, cuenta), cuenta)]
+        now = time.time()
+        query = "SELECT cycle, account, payload FROM jobs WHERE (status = 'pending' OR (status = 'claimed' AND claimed_at < ?))"
+        params = [now - self.lease]
+        if shards is not None:
+            query += f" AND shard IN ({','.join('?' * len(shards))})"
+            params.extend(shards)
+        with self._transaction():
+            rows = self.conn.execute(query + ' ORDER BY cycle LIMIT ?', [*params, limit]).fetchall()
+            self.conn.executemany(
+                "UPDATE jobs SET status = 'claimed', worker = ?, claimed_at = ? WHERE cycle = ? AND account = ?",
+                [(worker, now, cycle, account) for cycle, account, _ in rows]
+            )
+        return [((cycle, account), Account(**json.loads(payload))) for cycle, account, payload in rows]
+
+    def complete(self, job, worker, result):
+        # Solo vale el resultado de quien tiene el trabajo: si venció y otro lo
+        # retomó, o el coordinador ya lo canceló, el resultado tardío se descarta
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'done', result = ? WHERE cycle = ? AND account = ? AND status = 'claimed' AND worker = ?",
+            (json.dumps(result), *job, worker)
+        )
+        return cursor.rowcount == 1
+
+    def collect(self, cycle, timeout, poll_interval=0.1):
+        # Entrega (cuenta, resultado) conforme terminan los trabajos del ciclo.
+        # Al vencer `timeout` los que falten se cancelan
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._transaction():
+                rows = self.conn.execute(
+                    "SELECT account, result FROM jobs WHERE cycle = ? AND status = 'done'", (cycle,)
+                ).fetchall()
+                self.conn.execute("DELETE FROM jobs WHERE cycle = ? AND status = 'done'", (cycle,))
+                remaining = self.conn.execute('SELECT COUNT(*) FROM jobs WHERE cycle = ?', (cycle,)).fetchone()[0]
+            for account, result in rows:
+                yield account, json.loads(result)
+            if not remaining:
+                return
+            if time.monotonic() >= deadline:
+                self.conn.execute('DELETE FROM jobs WHERE cycle = ?', (cycle,))
+                return
+            time.sleep(poll_interval)
 
-    def check_discounts(self):
-        logging.info("Iniciando verificación de descuentos...")
-        all_messages = []
-        urgent_messages = []
-        first_run = not bool(self.previous_discounts)  # Verificar si es la primera ejecución
+    def clear(self):
+        # Descarta los trabajos que dejó una ejecución anterior del coordinador
+        self.conn.execute('DELETE FROM jobs')
+
+    def close(self):
+        self.conn.close()
+
+
+class U4UBot:
+    def __init__(self, accounts, phone_number, max_workers=8, per_host=2, max_pages=20, page_window=3,
+                 state_path='u4u_state.db', history_path='u4u_history', transport=None,
+                 jobs=None, shards=1, job_timeout=600, cache_ttl=120, cache_bytes=64 * 2**20,
+                 snapshot_path=None, snapshot_bytes=512 * 2**20, timeout=(5, 20), max_retries=2, rate_limits=None,
+                 dry_run=False, matcher=None):
+        self.accounts = accounts  # Lista de Account
+        self.phone_number = phone_number  # Guardamos el número de teléfono
+        self.metrics = Metrics()
+        cache = ResponseCache(cache_ttl, cache_bytes) if cache_ttl else None
+        if rate_limits is None:
+            rate_limits = {platform: spec['rate_limit'] for platform, spec in PLATFORM_SPECS.items() if 'rate_limit' in spec}
+        self.fetcher = FetchEngine(max_workers=max_workers, per_host=per_host, metrics=self.metrics, cache=cache,
+                                   timeout=timeout, max_retries=max_retries, rate_limits=rate_limits)
+        self.snapshots = SnapshotStore(snapshot_path, snapshot_bytes) if snapshot_path else None
+        self.max_pages = max_pages  # Límite de páginas por cuenta y ciclo
+        self.page_window = page_window  # Páginas descargándose a la vez por cuenta
         
-        # Verificar productos
-        for account in self.accounts:
-            if account['platform'] == 'MercadoLibre':
-                products = self.get_product_info(account)
-            elif account['platform'] == 'Amazon':
-                products = self.get_amazon_products(account['url'])
-            else:  # Shein
-                products = self.get_shein_products(account['url'])
-            
-            if not products:
-                logging.warning(f"No se encontraron productos para {account['name']}")
-                continue
-            
-            message_parts = [f"🏪 {account['name'].upper()} ({account['platform']})\n{'='*30}\n"]
-            changes_detected = False
+        self.state = DiscountStateStore(state_path, read_only=dry_run)  # Descuentos por cuenta y producto
+        self.history = PriceHistory(history_path) if history_path else None
+        self.notifier = NotificationDispatcher(transport or WhatsAppTransport(phone_number), metrics=self.metrics)
+        self.last_products = {}  # Últimos productos por URL, para reutilizarlos si la página no cambió
+        self.page_digests = {}  # Huella del cuerpo de cada URL, para páginas que no usan ETag
+        self.card_fingerprints = {}  # {URL: {huella de tarjeta: producto}} de la última descarga
+        self.account_urls = defaultdict(set)  # URLs visitadas por cuenta, para liberarlas si la cuenta se quita
+        self.incomplete_crawls = set()  # Cuentas cuyo último recorrido no llegó al final del catálogo
+        self.last_cycle_stats = {}
+        self.pending_events = {}  # {cuenta: {producto: último evento}} en espera del reporte programado
+        self.jobs = jobs  # Con una JobQueue, las páginas las descargan procesos trabajadores
+        self.shards = shards
+        # Fragmento fijo por cuenta, repartido por turnos para equilibrar la carga. Así
+        # el mismo trabajador revisa siempre la cuenta y aprovecha sus ETag y huellas
+        self.shard_of = {account.name: index % shards for index, account in enumerate(accounts)}
+        self.job_timeout = job_timeout  # Segundos que se espera a los trabajadores por ciclo
+        self.last_report_slot = None
+        self.dry_run = dry_run  # Revisa y avisa, pero sin guardar estado ni historial
+        self.matcher = matcher or ProductMatcher()  # El mismo producto en distintas plataformas
+        self.matcher.load_divergent(self.state.divergent_pairs())
+        # Las parejas de cuentas que se quitaron mientras el bot no corría ya no se revisarán
+        names = {account.name for account in accounts}
+        for account in {key[0] for key in self.matcher.divergent} - names:
+            self.matcher.discard_account(account)
+        logging.info(f"Bot iniciado con {len(accounts)} cuentas y número {phone_number}")
+
+    def send_whatsapp_message(self, message):
+        # El envío real lo hace el hilo del despachador
+        self.notifier.enqueue(message)
+
+    def update_accounts(self, accounts, removed=(), phone_number=None):
+        # Aplica una configuración recargada entre ciclos. Las cuentas quitadas
+        # o modificadas sueltan sus páginas guardadas, y las que ya no existen
+        # también sus cambios pendientes de reportar
+        self.accounts = accounts
+        names = {account.name for account in accounts}
+        for name in removed:
+            for url in self.account_urls.pop(name, ()):
+                self.last_products.pop(url, None)
+                self.page_digests.pop(url, None)
+                self.card_fingerprints.pop(url, None)
+                self.fetcher.forget(url)
+            if name not in names:
+                self.pending_events.pop(name, None)
+                self.shard_of.pop(name, None)
+                self.matcher.discard_account(name)
+        if phone_number and phone_number != self.phone_number:
+            self.phone_number = phone_number
+            if isinstance(self.notifier.transport, WhatsAppTransport):
+                self.notifier.transport = WhatsAppTransport(phone_number)
+            logging.info(f"Número de teléfono actualizado a {phone_number}")
+
+    def _remember_products(self, url, products):
+        # Solo se revalida con 304 una página que sí produjo productos
+        if products:
+            self.last_products[url] = products
+        else:
+            self.last_products.pop(url, None)
+            self.page_digests.pop(url, None)
+            self.card_fingerprints.pop(url, None)
+            self.fetcher.forget(url)
+
+    def scrape_page(self, account, url):
+        platform = account.platform
+        extractor = EXTRACTORS[platform].for_url(url)
+        logging.info(f"Obteniendo productos de {account.name} ({url})")
+        self.account_urls[account.name].add(url)
+        try:
+            response = self.fetcher.get(url, headers=extractor.headers, platform=platform,
+                                        conditional=url in self.last_products, block_marker=extractor.block_marker)
+            logging.info(f"Respuesta del servidor {platform}: {response.status_code}")
+            if self.snapshots:
+                self.snapshots.record(account, url, response)
+            if response.status_code == 304:
+                logging.info(f"Sin cambios en la página de {account.name}, se reutilizan los productos anteriores")
+                return self.last_products[url]
+            response.raise_for_status()
             
-            account_key = account['name']
-            if account_key not in self.previous_discounts:
-                self.previous_discounts[account_key] = {}
+            # Sin ETag el servidor responde 200 aunque nada cambió; el mismo cuerpo da los mismos productos
+            digest = hashlib.blake2b(response.content, digest_size=16).digest()
+            if url in self.last_products and self.page_digests.get(url) == digest:
+                logging.info(f"Página de {account.name} idéntica a la anterior, se reutilizan los productos")
+                return self.last_products[url]
             
-            for product in products:
-                current_discount = product['discount']
-                previous_discount = self.previous_discounts[account_key].get(product['title'], None)
-                
-                # Mensaje base del producto
-                product_info = (
-                    f"\n📦 Producto: {product['title']}\n"
-                    f"💰 Precio original: ${product['original_price']}\n"
-                    f"🏷️ Precio actual: ${product['current_price']}\n"
-                    f"📊 Descuento: {current_discount}%\n"
-                )
-                
-                # Verificar si el producto perdió su descuento
-                if previous_discount is not None and previous_discount > 0 and current_discount == 0:
-                    urgent_message = (
-                        f"\n{'🚨'*5} ¡ALERTA URGENTE! {'🚨'*5}\n"
-                        f"{'='*40}\n"
-                        f"❌ PRODUCTO SIN DESCUENTO ❌\n"
-                        f"📦 Producto: {product['title']}\n"
-                        f"💰 Precio actual: ${product['current_price']}\n"
-                        f"⚠️ ¡ACCIÓN INMEDIATA REQUERIDA!\n"
-                        f"{'='*40}\n"
-                    )
-                    urgent_messages.append(urgent_message)
-                
-                # Agregar al reporte regular
-                if current_discount == 0:
-                    product_info = (
-                        f"\n⚠️ PRODUCTO SIN DESCUENTO\n"
-                        f"📦 Producto: {product['title']}\n"
-                        f"💰 Precio: ${product['original_price']}\n"
-                    )
-                    changes_detected = True
-                elif previous_discount is None:
-                    product_info += "✨ (Nuevo producto)\n"
-                    changes_detected = True
-                elif current_discount != previous_discount:
-                    if current_discount < previous_discount:
-                        product_info += f"📉 Descuento REDUCIDO: {previous_discount}% → {current_discount}%\n"
-                    else:
-                        product_info += f"📈 Descuento AUMENTADO: {previous_discount}% → {current_discount}%\n"
-                    changes_detected = True
+            with self.metrics.timer('u4u_stage_seconds', stage='parse', platform=platform):
+                soup = extractor.parse(response.text)
+            with self.metrics.timer('u4u_stage_seconds', stage='extract', platform=platform):
+                products, fingerprints = extractor.extract_all(soup, self.metrics, self.card_fingerprints.get(url))
+            self.metrics.inc('u4u_products_total', len(products), platform=platform)
+            logging.info(f"Total de productos encontrados en {platform}: {len(products)}")
+            self.page_digests[url] = digest
+            self.card_fingerprints[url] = fingerprints
+            self._remember_products(url, products)
+            return products
+        except requests.RequestException as e:
+            # Fallas de red o del host: ya se reintentaron, basta con el mensaje
+            logging.error(f"Error al obtener productos de {account.name}: {str(e)}")
+            self.metrics.inc('u4u_scrape_errors_total', platform=platform, reason=type(e).__name__)
+            return None
+        except Exception as e:
+            logging.error(f"Error al obtener productos de {account.name}: {str(e)}", exc_info=True)
+            self.metrics.inc('u4u_scrape_errors_total', platform=platform, reason=type(e).__name__)
+            return None
+
+    def crawl(self, accounts):
+        # Recorre las páginas de todas las cuentas en paralelo y entrega
+        # (cuenta, página, productos nuevos) conforme llega cada página. Tras la
+        # primera página se pide solo la siguiente; si esa también trae productos
+        # nuevos, el catálogo tiene varias páginas y se mantienen `page_window`
+        # páginas en vuelo por cuenta. Se deja de avanzar cuando una página viene vacía,
+        # repite lo ya visto o trae menos productos que una página completa.
+        # Al terminar, `incomplete_crawls` tiene las cuentas con páginas fallidas
+        # o cortadas por `max_pages`, cuyos productos faltantes no son retiros
+        if self.jobs:
+            yield from self._crawl_jobs(accounts)
+            return
+        if self.snapshots:
+            self.snapshots.start_cycle()
+        try:
+            yield from self._crawl_pages(accounts)
+        finally:
+            if self.snapshots:
+                self.snapshots.end_cycle()
+
+    def _crawl_pages(self, accounts):
+        pending = {}
+        crawls = {}
+
+        def submit(account, page):
+            url = page_url(account, page)
+            future = self.fetcher.submit(self.scrape_page, account, url, host=urlsplit(url).netloc)
+            pending[future] = (account, page)
+
+        for account in accounts:
+            crawls[account.name] = {'seen': set(), 'next_page': 2, 'stopped': False, 'complete': True}
+            submit(account, 1)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                account, page = pending.pop(future)
+                crawl = crawls[account.name]
+                products = future.result()
+                if products is None:
+                    crawl['complete'] = False
+                    crawl['stopped'] = True
+                    continue
+                # Una misma tarjeta puede venir repetida en la página (contenedores
+                # anidados) o en páginas anteriores; solo pasan los productos nuevos
+                new_products = []
+                for product in products:
+                    pid = product_id(product)
+                    if pid not in crawl['seen']:
+                        crawl['seen'].add(pid)
+                        new_products.append(product)
+                if not new_products:
+                    if page > 1 and not crawl['stopped']:
+                        logging.info(f"Fin del catálogo de {account.name} en la página {page}")
+                    crawl['stopped'] = True
+                    continue
+                yield account, page, new_products
                 
-                message_parts.append(product_info)
-                self.previous_discounts[account_key][product['title']] = current_discount
+                # Con tamaño de página fijo (Mercado Libre), una página incompleta es la última
+                page_size = EXTRACTORS[account.platform].pagination.get('page_size')
+                if page_size and len(products) < page_size:
+                    crawl['stopped'] = True
+                    continue
+                last_page = min(page + (self.page_window if page > 1 else 1), self.max_pages)
+                while not crawl['stopped'] and crawl['next_page'] <= last_page:
+                    submit(account, crawl['next_page'])
+                    crawl['next_page'] += 1
+                if page == self.max_pages:
+                    crawl['complete'] = False  # Puede haber más páginas sin recorrer
+        
+        self.incomplete_crawls = {name for name, crawl in crawls.items() if not crawl['complete']}
+
+    def _crawl_jobs(self, accounts):
+        # Modo coordinador: cada cuenta se vuelve un trabajo y sus páginas llegan
+        # ya extraídas desde los trabajadores. El estado y los avisos se quedan
+        # en este proceso, así que cada cambio se notifica una sola vez
+        by_name = {account.name: account for account in accounts}
+        new_accounts = [account for account in accounts if account.name not in self.shard_of]
+        if new_accounts:
+            # Las cuentas agregadas en caliente van al fragmento con menos cuentas
+            load = Counter({shard: 0 for shard in range(self.shards)})
+            load.update(self.shard_of.values())
+            for account in new_accounts:
+                shard = min(load, key=load.get)
+                self.shard_of[account.name] = shard
+                load[shard] += 1
+        cycle = self.jobs.submit((account, self.shard_of[account.name]) for account in accounts)
+        waiting = set(by_name)
+        incomplete = set()
+        for name, result in self.jobs.collect(cycle, self.job_timeout):
+            waiting.discard(name)
+            self.metrics.inc('u4u_jobs_total', result='done')
+            if not result['complete']:
+                incomplete.add(name)
+            for page, products in result['pages']:
+                yield by_name[name], page, [Product(**product) for product in products]
+        if waiting:
+            logging.warning(f"Sin respuesta de los trabajadores para: {', '.join(sorted(waiting))}")
+            self.metrics.inc('u4u_jobs_total', len(waiting), result='timeout')
+        self.incomplete_crawls = incomplete | waiting
+
+    def check_discounts(self, accounts=None):
+        # Revisa las cuentas indicadas (todas por defecto) y devuelve, por
+        # cuenta, si cambió algo ('changed'), nada ('stable') o falló ('error').
+        # Solo los productos nuevos o con cambios generan eventos y se escriben;
+        # el texto de los mensajes se arma únicamente para lo que se envía
+        accounts = accounts or self.accounts
+        logging.info(f"Iniciando verificación de descuentos de {len(accounts)} cuentas...")
+        cycle_start = time.perf_counter()
+        first_run = self.state.is_empty()  # Verificar si es la primera ejecución
+        events = []
+        seen = defaultdict(set)  # Productos vistos por cuenta en este ciclo
+        snapshot = []  # Filas de los productos nuevos o con cambios
+        history_rows = []  # (producto, cuenta, precio original, precio actual, descuento)
+        matched = []  # Productos que hay que volver a comparar con otras plataformas
+        
+        # Descargar todas las páginas en paralelo y procesar cada una en cuanto llega
+        for account, page, products in self.crawl(accounts):
+            diff_start = time.perf_counter()
+            account_key = account.name
+            ids = [product_id(product) for product in products]
+            known = self.state.lookup(account_key, ids)
+            seen[account_key].update(ids)
             
-            if changes_detected or first_run:
-                message = "".join(message_parts)
-                all_messages.append(message)
+            for product, pid in zip(products, ids):
+                previous = known.get(pid)
+                event = diff_product(account, pid, product, previous)
+                if event:
+                    events.append(event)
+                # Las filas guardadas antes de registrar precios se completan sin generar evento
+                if event or previous.current_price is None:
+                    snapshot.append((account_key, pid, product.title, product.discount,
+                                     product.original_price, product.current_price))
+                history_rows.append((pid, account_key, product.original_price, product.current_price, product.discount))
+                if self.matcher.update(MatchEntry(account_key, account.platform, pid, product.title,
+                                                  product.discount, product.current_price)):
+                    matched.append((account_key, pid))
+            self.metrics.observe('u4u_stage_seconds', time.perf_counter() - diff_start, stage='diff', platform=account.platform)
+        
+        # Lo guardado que ya no aparece se retiró, pero solo se puede afirmar
+        # si el recorrido de la cuenta llegó al final del catálogo
+        removed = []
+        for account in accounts:
+            if seen[account.name] and account.name not in self.incomplete_crawls:
+                for pid, previous in self.state.missing(account.name, seen[account.name]).items():
+                    events.append(ChangeEvent(REMOVED, account.name, account.platform, pid, None, previous))
+                    removed.append((account.name, pid))
+                    self.matcher.discard((account.name, pid))
         
-        # Enviar mensajes urgentes inmediatamente (productos sin descuento)
-        if urgent_messages:
-            urgent_final = "🚨 ¡ALERTAS URGENTES! 🚨\n\n" + "\n\n".join(urgent_messages)
-            urgent_final += f"\n\n⏰ Alerta generada: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
-            self.send_whatsapp_message(urgent_final)
+        if self.dry_run:
+            logging.info(f"Simulación: no se guardan {len(snapshot)} productos nuevos o con cambios ni {len(removed)} retirados")
+        else:
+            self.state.save_snapshot(snapshot, removed)
+            if self.history:
+                self.history.append(history_rows)
         
-        # Enviar reporte completo en primera ejecución o en horarios programados
-        current_hour = datetime.now().hour
-        if first_run or current_hour in [9, 18]:  # Primera ejecución o 9 AM/6 PM
-            if all_messages:
-                header = "📊 REPORTE INICIAL DE PRODUCTOS 📊\n\n" if first_run else "📊 REPORTE PROGRAMADO 📊\n\n"
-                final_message = header + "\n\n".join(all_messages)
-                final_message += f"\n\n⏰ Reporte generado: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
-                self.send_whatsapp_message(final_message)
+        event_counts = defaultdict(int)
+        for event in events:
+            self.pending_events.setdefault(event.account, {})[event.product_id] = event
+            event_counts[event.kind, event.platform] += 1
+        for (kind, platform), count in event_counts.items():
+            self.metrics.inc('u4u_change_events_total', count, kind=kind, platform=platform)
+        changed_accounts = set() if first_run else {event.account for event in events}
+        outcomes = {}
+        for account in accounts:
+            if not seen[account.name]:
+                if account.name in self.incomplete_crawls:
+                    logging.warning(f"No se pudo revisar {account.name}; se reintentará más adelante")
+                else:
+                    logging.warning(f"No se encontraron productos para {account.name}")
+                outcomes[account.name] = 'error'
             else:
-                logging.info("No hay cambios para reportar")
+                outcomes[account.name] = 'changed' if account.name in changed_accounts else 'stable'
+        cycle_seconds = time.perf_counter() - cycle_start
+        self.metrics.observe('u4u_stage_seconds', cycle_seconds, stage='cycle', platform='-')
+        self.metrics.inc('u4u_cycles_total')
+        logging.info(f"Ciclo de verificación completado en {cycle_seconds:.2f}s, {len(events)} cambios")
+        stats = self.last_cycle_stats = self.fetcher.cycle_stats()
+        logging.info(
+            f"Red: {stats['requests']} solicitudes, {stats['not_modified']} sin cambios (304), "
+            f"{stats['bytes'] / 1024:.1f} KB transferidos, {stats['handshakes_saved']} conexiones reutilizadas"
+        )
+        
+        # Enviar mensajes urgentes inmediatamente (productos que perdieron su descuento)
+        urgent = [event for event in events if event.kind == DISCOUNT_LOST]
+        if urgent:
+            with self.metrics.timer('u4u_stage_seconds', stage='format', platform='-'):
+                message = render_urgent(urgent)
+            self.send_whatsapp_message(message)
+        
+        # El mismo producto con precio o descuento distinto en otra plataforma
+        with self.metrics.timer('u4u_stage_seconds', stage='match', platform='-'):
+            divergences = self.matcher.divergences(matched)
+        if divergences:
+            for divergence in divergences:
+                for reason in divergence.reasons:
+                    self.metrics.inc('u4u_divergences_total', reason=reason)
+            logging.info(f"{len(divergences)} productos con precio o descuento distinto entre plataformas")
+            self.send_whatsapp_message(render_divergences(divergences))
+        added, cleared = self.matcher.take_changes()
+        if not self.dry_run:
+            self.state.save_divergences(added, cleared)
+        
+        # Enviar reporte completo en primera ejecución; el de los horarios
+        # programados lo envía send_scheduled_report desde el ciclo principal
+        if first_run:
+            self.last_report_slot = datetime.now().strftime('%Y-%m-%d %H')
+            self.send_report(first_run)
+        
+        return outcomes
+
+    def send_scheduled_report(self, now=None):
+        # Reporte de las 9 AM y 6 PM, una sola vez por horario. Como las cuentas
+        # se revisan a ritmos distintos, los cambios se acumulan hasta entonces;
+        # se revisa en cada vuelta del ciclo principal, aunque ninguna cuenta
+        # venza en esa hora
+        now = now or datetime.now()
+        report_slot = now.strftime('%Y-%m-%d %H')
+        if now.hour in [9, 18] and report_slot != self.last_report_slot:
+            self.last_report_slot = report_slot
+            self.send_report()
+
+    def send_report(self, first_run=False):
+        # Envía los cambios acumulados desde el último reporte
+        with self.metrics.timer('u4u_stage_seconds', stage='format', platform='-'):
+            message = render_report(self.accounts, self.pending_events, first_run)
+        self.pending_events = {}
+        if message:
+            self.send_whatsapp_message(message)
+        else:
+            logging.info("No hay cambios para reportar")
+
+def run_worker(queue_path, shards=None, batch=4, poll_interval=0.5, stop=None, **bot_options):
+    # Proceso trabajador: toma cuentas de la tabla de trabajos, recorre sus
+    # páginas y devuelve los productos extraídos. No guarda estado ni envía
+    # mensajes; de eso se encarga solo el coordinador
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    jobs = JobQueue(queue_path)
+    bot = U4UBot([], None, state_path=':memory:', history_path=None,
+                 transport=FileTransport(os.devnull), **bot_options)
+    logging.info(f"Trabajador {worker} atendiendo fragmentos {shards if shards is not None else 'todos'}")
+    while stop is None or not stop.is_set():
+        try:
+            claimed = jobs.claim(worker, shards, limit=batch)
+            if not claimed:
+                time.sleep(poll_interval)
+                continue
+            results = {account.name: {'pages': [], 'complete': True} for _, account in claimed}
+            for account, page, products in bot.crawl([account for _, account in claimed]):
+                results[account.name]['pages'].append([page, [product._asdict() for product in products]])
+            for name in bot.incomplete_crawls:
+                results[name]['complete'] = False
+            for job, account in claimed:
+                if not jobs.complete(job, worker, results[account.name]):
+                    logging.warning(f"El trabajo de {account.name} ya no era de este trabajador, se descarta")
+        except Exception as e:
+            logging.error(f"Error en el trabajador {worker}: {str(e)}", exc_info=True)
+            time.sleep(poll_interval)
+    bot.fetcher.shutdown()
+    jobs.close()
+
+
+def start_workers(queue_path, count, shards=None, **worker_options):
+    # Lanza `count` procesos trabajadores locales y les reparte los fragmentos
+    # 0..shards-1; los fragmentos sobrantes quedan para trabajadores de otros
+    # equipos. Debe llamarse antes de crear hilos en este proceso
+    shards = shards or count
+    stop = multiprocessing.Event()
+    processes = []
+    for index in range(count):
+        process = multiprocessing.Process(
+            target=run_worker, args=(queue_path, list(range(index, shards, count))),
+            kwargs={'stop': stop, **worker_options}, name=f'u4u-worker-{index}', daemon=True
+        )
+        process.start()
+        processes.append(process)
+    return stop, processes
+
+
+def replay_snapshots(args):
+    # Vuelve a parsear las páginas guardadas de un ciclo, sin conexión
+    snapshots = SnapshotStore(args.snapshots)
+    cycles = snapshots.cycles()
+    if args.list or not cycles:
+        for cycle in cycles:
+            print(f"{cycle}  {len(snapshots.entries(cycle))} páginas")
+        if not cycles:
+            print(f"No hay ciclos guardados en {args.snapshots}")
+        return
+    cycle = args.cycle or cycles[-1]
+    if cycle not in cycles:
+        print(f"No existe el ciclo {cycle}; usa --list para ver los disponibles")
+        return
+    results = []
+    seen = defaultdict(set)  # Como en el recorrido: cada producto una sola vez por cuenta
+    for entry in snapshots.entries(cycle):
+        if args.account and entry['account'] != args.account:
+            continue
+        try:
+            body = snapshots.body(entry)
+        except (OSError, ValueError) as e:
+            print(f"{entry['account']:<30} sin copia de {entry['url']}: {str(e)}")
+            continue
+        html = body.decode(entry['encoding'], errors='replace') if entry['encoding'] else body
+        extractor = EXTRACTORS[entry['platform']].for_url(entry['url'])
+        products, _ = extractor.extract_all(extractor.parse(html))
+        new_products = []
+        for product in products:
+            pid = product_id(product)
+            if pid not in seen[entry['account']]:
+                seen[entry['account']].add(pid)
+                new_products.append(product)
+        products = new_products
+        results.append({**entry, 'products': [product._asdict() for product in products]})
+        if not args.json:
+            print(f"{entry['fetched_at']}  {entry['account']:<30} {entry['status']}  {len(products):>5} productos  {entry['url']}")
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+def show_history(args):
+    history = PriceHistory(args.history_path)
+    since = datetime.now() - timedelta(days=args.days) if args.days else None
+    if args.history_command == 'product':
+        rows = history.timeline(args.product_id, since=since)
+        if not rows:
+            print(f"Sin historial para {args.product_id}")
+            return
+        for timestamp, account, original, current, discount in rows:
+            print(f"{timestamp:%d/%m/%Y %H:%M}  {account:<30} ${original:>9.2f}  ${current:>9.2f}  {discount:5.1f}%")
+        for lost_at in history.discount_losses(args.product_id, rows=rows):
+            print(f"❌ Perdió su descuento el {lost_at:%d/%m/%Y %H:%M}")
+    else:
+        print(f"{'Cuenta':<30} {'Obs.':>7} {'Prod.':>6} {'Desc. prom.':>11} {'Desc. máx.':>10} {'Con desc.':>9}")
+        for row in history.store_rollup(since=since):
+            print(
+                f"{row['account']:<30} {row['observations']:>7} {row['products']:>6} "
+                f"{row['avg_discount']:>10.1f}% {row['max_discount']:>9.1f}% {row['discounted_share']:>8.1f}%"
+            )
+
 
 def main():
+    parser = argparse.ArgumentParser(description='Bot de monitoreo de descuentos U4U')
+    parser.add_argument('--metrics-port', type=int, default=None, help='Servir métricas en http://127.0.0.1:PUERTO/metrics')
+    parser.add_argument('--metrics-json', default=None, help='Escribir las métricas en este archivo JSON tras cada ciclo')
+    subparsers = parser.add_subparsers(dest='command')
+    history = subparsers.add_parser('history', help='Consultar el historial de precios y descuentos')
+    history.add_argument('--history-path', default='u4u_history')
+    history.add_argument('--days', type=int, default=None, help='Solo los últimos N días')
+    history_commands = history.add_subparsers(dest='history_command', required=True)
+    product = history_commands.add_parser('product', help='Línea de tiempo de un producto')
+    product.add_argument('product_id', help='MLM, ASIN o SHEIN<id>')
+    history_commands.add_parser('stores', help='Resumen por tienda')
+    parser.add_argument('--config', default='u4u_accounts.json', help='Archivo o directorio de cuentas (JSON, TOML o YAML)')
+    parser.add_argument('--reload-interval', type=float, default=10, help='Cada cuántos segundos revisar si la configuración cambió')
+    parser.add_argument('--snapshots', default='u4u_snapshots', help='Directorio para las copias comprimidas de las páginas ("" para no guardarlas)')
+    parser.add_argument('--snapshot-mb', type=int, default=512, help='Tamaño máximo del directorio de copias')
+    parser.add_argument('--workers', type=int, default=0, help='Procesos trabajadores locales (0 = todo en este proceso)')
+    parser.add_argument('--shards', type=int, default=None, help='Fragmentos en que se reparten las cuentas (por defecto, uno por trabajador)')
+    parser.add_argument('--queue', default='u4u_jobs.db', help='Tabla de trabajos compartida con los trabajadores')
+    parser.add_argument('--once', action='store_true', help='Revisar todas las cuentas una vez, reportar los cambios y salir (p. ej. desde cron)')
+    parser.add_argument('--dry-run', action='store_true', help='Una sola revisión que imprime los mensajes en lugar de enviarlos y no guarda nada')
+    worker = subparsers.add_parser('worker', help='Atender trabajos de un coordinador, p. ej. desde otro equipo')
+    worker.add_argument('--queue', default='u4u_jobs.db')
+    worker.add_argument('--shards', default=None, help='Fragmentos a atender, separados por comas (por defecto, todos)')
+    worker.add_argument('--batch', type=int, default=4, help='Cuentas que se toman a la vez')
+    worker.add_argument('--snapshots', default='u4u_snapshots')
+    worker.add_argument('--snapshot-mb', type=int, default=512)
+    replay = subparsers.add_parser('replay', help='Volver a parsear las páginas guardadas de un ciclo')
+    replay.add_argument('--snapshots', default='u4u_snapshots')
+    replay.add_argument('--cycle', default=None, help='Ciclo a reproducir (por defecto, el último)')
+    replay.add_argument('--account', default=None, help='Solo las páginas de esta cuenta')
+    replay.add_argument('--list', action='store_true', help='Listar los ciclos guardados')
+    replay.add_argument('--json', action='store_true', help='Imprimir los productos extraídos en JSON')
+    args = parser.parse_args()
+    setup_logging()
+
+    if args.command == 'history':
+        show_history(args)
+    elif args.command == 'worker':
+        shards = [int(shard) for shard in args.shards.split(',')] if args.shards else None
+        run_worker(args.queue, shards, batch=args.batch,
+                   snapshot_path=args.snapshots or None, snapshot_bytes=args.snapshot_mb * 2**20)
+    elif args.command == 'replay':
+        replay_snapshots(args)
+    elif not run_bot(args):
+        sys.exit(1)
+
+
+def reload_accounts(config, bot, scheduler):
+    # Aplica los cambios del archivo de cuentas sin detener nada: solo se
+    # agregan o quitan de la agenda las cuentas que cambiaron
+    try:
+        changes = config.reload()
+    except (OSError, ValueError) as e:
+        logging.error(f"Configuración de cuentas inválida, se conservan las cuentas actuales: {str(e)}")
+        return
+    if changes is None:
+        return
+    added, removed = changes
+    for name in removed:
+        scheduler.remove(name)
+    bot.update_accounts(list(config.accounts.values()), removed, config.phone_number)
+    for account in added:
+        scheduler.add(account)
+    logging.info(f"Configuración recargada: {len(added)} cuentas nuevas o modificadas, {len(removed)} quitadas o modificadas")
+
+
+def run_once(bot):
+    # Una sola revisión de todas las cuentas. Los cambios se reportan al
+    # terminar, porque entre una ejecución y otra no queda nada en memoria
+    outcomes = bot.check_discounts()
+    if bot.pending_events:
+        bot.send_report()
+    bot.notifier.close()
+    bot.fetcher.shutdown()
+    failed = sorted(name for name, outcome in outcomes.items() if outcome == 'error')
+    if failed:
+        logging.warning(f"Revisión terminada con {len(failed)} cuentas sin revisar: {', '.join(failed)}")
+    return not failed
+
+
+def run_bot(args):
+    # Devuelve si todo salió bien; solo --once y --dry-run terminan sin error
     try:
         logging.info("Iniciando el bot...")
+        once = args.once or args.dry_run
         
-        # Configuración de las cuentas
-        accounts = [
-            {
-                'name': 'Marcas y Licencias Godlval',
-                'url': 'https://listado.mercadolibre.com.mx/_CustId_366058927?item_id=MLM774983214&category_id=MLM437528&seller_id=366058927&client=recoview-selleritems&recos_listing=true#origin=vip&component=sellerData&typeSeller=classic',
-                'type': 'normal',
-                'platform': 'MercadoLibre'
-            },
-            {
-                'name': 'Grupo Maquilero',
-                'url': 'https://listado.mercadolibre.com.mx/tienda/u4u/',
-                'type': 'official',
-                'platform': 'MercadoLibre'
-            },
-            {
-                'name': 'U4U Amazon Store',
-                'url': 'https://www.amazon.com.mx/s?k=u4u+uniformes&crid=7HLPL67JZQDM&sprefix=U4U+UNIFOEM%2Caps%2C131&ref=nb_sb_ss_mvt-t9-ranker_1_11',
-                'platform': 'Amazon'
-            },
-            {
-                'name': 'U4U Shein Grupo Maquilero',
-                'url': 'https://www.shein.com.mx/Brands/U4U-Uniforms-sc-0141887884.html',
-                'platform': 'Shein'
-            },
-            {
-                'name': 'U4U Shein Pure and Simple',
-                'url': 'https://www.shein.com.mx/store/home?store_code=7833912084',
-                'platform': 'Shein'
-            }
-        ]
+        # Cuentas y número de teléfono desde el archivo de configuración
+        config = AccountConfig(args.config)
+        config.reload()
+        if not config.phone_number and not args.dry_run:
+            raise ValueError(f"{args.config} no define phone_number")
+        accounts = list(config.accounts.values())
+        logging.info(f"{len(accounts)} cuentas cargadas de {args.config}")
         
-        phone_number = "+52 1 55 1836 1539"
-        bot = U4UBot(accounts, phone_number)
+        jobs = None
+        workers = None
+        shards = args.shards or args.workers or 1
+        snapshot_path = None if args.dry_run else args.snapshots or None
+        if args.workers or args.shards:
+            workers = start_workers(args.queue, args.workers, shards,
+                                    snapshot_path=snapshot_path, snapshot_bytes=args.snapshot_mb * 2**20)
+            jobs = JobQueue(args.queue)
+            jobs.clear()
+        # La simulación lee el estado guardado, si existe, pero no lo crea ni lo modifica
+        state_path = 'u4u_state.db'
+        if args.dry_run and not os.path.exists(state_path):
+            state_path = ':memory:'
+        bot = U4UBot(accounts, config.phone_number, jobs=jobs, shards=shards, state_path=state_path,
+                     history_path=None if args.dry_run else 'u4u_history',
+                     transport=ConsoleTransport() if args.dry_run else None, dry_run=args.dry_run,
+                     snapshot_path=snapshot_path, snapshot_bytes=args.snapshot_mb * 2**20)
+        if args.metrics_port is not None:
+            start_metrics_server(bot.metrics, args.metrics_port)
         
-        # Primera verificación inmediata
-        logging.info("Ejecutando primera verificación...")
-        bot.check_discounts()
+        if once:
+            ok = run_once(bot)
+            if args.metrics_json:
+                bot.metrics.dump(args.metrics_json)
+            if workers:
+                stop, processes = workers
+                stop.set()
+                for process in processes:
+                    process.join()
+            return ok
         
-        # Programar la verificación cada hora
-        schedule.every(1).hours.do(bot.check_discounts)
-        logging.info("Verificación programada cada hora")
+        # Todas las cuentas vencen de inmediato para la primera verificación;
+        # después cada una se revisa según su propio intervalo
+        scheduler = AdaptiveScheduler()
+        for account in accounts:
+            scheduler.add(account)
         
         # Mantener el bot ejecutándose
         logging.info("Bot en ejecución...")
         while True:
-            schedule.run_pending()
-            time.sleep(60)
+            reload_accounts(config, bot, scheduler)
+            due = scheduler.pop_due()
+            if due:
+                outcomes = bot.check_discounts(due)
+                for name, outcome in outcomes.items():
+                    scheduler.record(name, outcome)
+                if args.metrics_json:
+                    bot.metrics.dump(args.metrics_json)
+            bot.send_scheduled_report()
+            next_due = scheduler.next_due()
+            wait_seconds = min(max(next_due - time.time(), 1), 60) if next_due else 60
+            time.sleep(min(wait_seconds, args.reload_interval))
     except Exception as e:
         logging.error(f"Error en la función principal: {str(e)}", exc_info=True)
+        return False
 
 if __name__ == "__main__":
-    main() 
-
-    
\ No newline at end of file
+    main()